@@ -0,0 +1,197 @@
+"""
+Command-line entry point for batch leaderboard queries.
+
+Usage:
+    python baseball_cli.py INFO_FILE QUERY_FILE [--format text|json]
+                           [--leaderboards BOARD_FILE]
+
+INFO_FILE is a JSON file holding the baseball data information dictionary
+(the "baseballdatainfo" dictionary of test_baseball_statistics).
+
+QUERY_FILE holds one query per line, "STAT K YEAR" or "STAT K career",
+where STAT is one of the built-in formulas (AVG, OBP, SLG, OPS):
+
+    AVG 5 1923
+    OPS 10 2010
+    AVG 20 career
+
+Blank lines and lines starting with '#' are ignored.  Use '-' to read
+queries from standard input.  The batting and master files are loaded
+once and every query is answered from memory; results are written as each
+query finishes.
+
+With --leaderboards, queries covered by a file built with leaderboards.py
+are answered from it without loading the batting data at all.  A file
+built from older versions of the batting or master file is ignored, with
+a warning, so that a batch never mixes stale and live answers.
+
+The dataset module is only imported, and the data only loaded, once the
+first query needs it, so argument errors and empty batches return
+immediately.
+"""
+
+import argparse
+import json
+import sys
+
+CAREER = "career"
+
+
+def parse_query(line):
+    """
+    Parses one line of a query file.
+
+    Args:
+        line (str): A line such as "OPS 10 2010" or "AVG 20 career".
+
+    Returns:
+        tuple: (stat, k, year), where year is an int or None for a career
+               query, or None for a blank or comment line.
+
+    Raises:
+        ValueError: If the line is not a valid query.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    parts = line.split()
+    if len(parts) != 3:
+        raise ValueError("expected 'STAT K YEAR' or 'STAT K career', got {!r}".format(line))
+    stat, numplayers, year = parts
+    numplayers = int(numplayers)
+    year = None if year.lower() == CAREER else int(year)
+    return stat.upper(), numplayers, year
+
+
+def read_queries(query_file):
+    """
+    Reads and validates every query in a query file.
+
+    Args:
+        query_file (file): An open query file.
+
+    Returns:
+        list: (stat, k, year) tuples, as returned by parse_query.
+
+    Raises:
+        ValueError: If a line is not a valid query; the message names the
+                    line number.
+    """
+    queries = []
+    for line_num, line in enumerate(query_file, 1):
+        try:
+            query = parse_query(line)
+        except ValueError as error:
+            raise ValueError("line {}: {}".format(line_num, error))
+        if query is not None:
+            queries.append(query)
+    return queries
+
+
+def run_queries(info, queries, boards=None):
+    """
+    Answers a batch of queries against one loaded dataset.
+
+    Args:
+        info (dict): Baseball data information dictionary.
+        queries (list): (stat, k, year) tuples.
+        boards (Leaderboards): Optional precomputed leaderboards, used for
+                               every query they can answer.
+
+    Yields:
+        tuple: ((stat, k, year), results) for each query, in order, where
+               results is a list of "x.xxx --- FirstName LastName" strings.
+    """
+    from isp_baseball_template import FORMULAS
+
+    data = None
+    for stat, numplayers, year in queries:
+        if boards is not None and boards.can_answer(stat, numplayers, year):
+            yield (stat, numplayers, year), boards.top_stats(stat, numplayers, year)
+            continue
+        if data is None:
+            from dataset import BattingDataset
+            data = BattingDataset.load(info)
+        formula = FORMULAS[stat]
+        if year is None:
+            results = data.compute_top_stats_career(formula, numplayers)
+        else:
+            results = data.compute_top_stats_year(formula, numplayers, year)
+        yield (stat, numplayers, year), results
+
+
+def write_text(output, query, results):
+    """
+    Writes one query's results as text.
+    """
+    stat, numplayers, year = query
+    period = "career" if year is None else "in {}".format(year)
+    output.write("Top {} {} {}\n".format(numplayers, stat, period))
+    for result in results:
+        output.write(result + "\n")
+    output.write("\n")
+
+
+def write_json(output, query, results):
+    """
+    Writes one query's results as a line of JSON.
+    """
+    stat, numplayers, year = query
+    record = {"stat": stat, "k": numplayers, "year": year, "results": results}
+    output.write(json.dumps(record) + "\n")
+
+
+def main(argv=None):
+    """
+    Runs the command-line interface.
+
+    Args:
+        argv (list): Command-line arguments.  Defaults to sys.argv[1:].
+
+    Returns:
+        int: The process exit status.
+    """
+    parser = argparse.ArgumentParser(description="Answer batch leaderboard queries.")
+    parser.add_argument("info_file", help="JSON file with the baseball data information")
+    parser.add_argument("query_file", help="file of 'STAT K YEAR|career' queries, or -")
+    parser.add_argument("--format", choices=("text", "json"), default="text",
+                        help="output format (default: text)")
+    parser.add_argument("--leaderboards", metavar="BOARD_FILE",
+                        help="precomputed leaderboard file from leaderboards.py")
+    args = parser.parse_args(argv)
+
+    with open(args.info_file, "r", encoding="utf-8") as info_file:
+        info = json.load(info_file)
+
+    from isp_baseball_template import FORMULAS
+    try:
+        if args.query_file == "-":
+            queries = read_queries(sys.stdin)
+        else:
+            with open(args.query_file, "r", encoding="utf-8") as query_file:
+                queries = read_queries(query_file)
+        for stat, _, _ in queries:
+            if stat not in FORMULAS:
+                raise ValueError("unknown stat {!r}; expected one of {}".format(
+                    stat, ", ".join(FORMULAS)))
+    except ValueError as error:
+        parser.error(str(error))
+
+    boards = None
+    if args.leaderboards:
+        from leaderboards import Leaderboards
+        boards = Leaderboards(args.leaderboards)
+        if not boards.is_current(info):
+            sys.stderr.write("warning: ignoring {}, built from other versions of the data files\n"
+                             .format(args.leaderboards))
+            boards = None
+
+    write = write_json if args.format == "json" else write_text
+    for query, results in run_queries(info, queries, boards):
+        write(sys.stdout, query, results)
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+Cross-implementation equivalence and speed matrix for the baseball
+functions.
+
+The repository holds several implementations of the same assignment API:
+isp_baseball_template.py (the reference), code.py, pyton.py, player.py and
+topplayer.py.  They take different arguments and coerce values differently
+(int versus float sums, a field name versus a formula function), so each is
+wrapped in an adapter that calls it on the same generated dataset and
+normalizes its output.  Every implementation of filter_by_year,
+top_player_ids, aggregate_by_player_id and compute_top_stats_year/career is
+checked against the reference and timed, and a table of throughput and
+peak traced memory is printed.
+
+All implementations rank by hits, the one statistic every one of them can
+compute.  Rankings agree if they have the same statistics in the same
+order and the same players above the last (possibly tied) value; ties at
+the cut-off may be broken differently.
+
+Usage:
+    python compare_implementations.py [--rows N [N ...]] [--repeat R] [--seed S]
+"""
+
+import argparse
+import csv
+import importlib.util
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Implementations in table order; the first is the reference.
+MODULES = ("isp_baseball_template", "code", "pyton", "player", "topplayer")
+
+OPERATIONS = ("filter_by_year", "top_player_ids", "aggregate_by_player_id",
+              "compute_top_stats_year", "compute_top_stats_career")
+
+BATTING_HEADER = ["playerID", "yearID", "stint", "teamID", "lgID", "G", "AB", "R", "H",
+                  "2B", "3B", "HR", "RBI", "SB", "CS", "BB", "SO", "IBB", "HBP", "SH",
+                  "SF", "GIDP"]
+
+YEARS = (1990, 2010)
+
+NUM_PLAYERS = 10
+
+
+def load_module(name):
+    """
+    Imports an implementation from this directory by path, so that code.py
+    does not clash with the standard library's code module.
+    """
+    spec = importlib.util.spec_from_file_location("impl_" + name,
+                                                  os.path.join(DIRECTORY, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    if DIRECTORY not in sys.path:
+        sys.path.insert(0, DIRECTORY)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_dataset(directory, num_rows, seed):
+    """
+    Writes a random Batting.csv and Master.csv with num_rows batting rows.
+
+    Returns:
+        dict: The baseball data information dictionary for the files.
+    """
+    rand = random.Random(seed)
+    players = ["p{:06d}".format(number) for number in range(max(10, num_rows // 8))]
+    battingfile = os.path.join(directory, "Batting.csv")
+    masterfile = os.path.join(directory, "Master.csv")
+    with open(battingfile, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(BATTING_HEADER)
+        for _ in range(num_rows):
+            at_bats = rand.randint(0, 700)
+            hits = rand.randint(0, at_bats // 3 + 1)
+            doubles = rand.randint(0, hits // 4)
+            triples = rand.randint(0, hits // 10)
+            home_runs = rand.randint(0, hits // 5)
+            writer.writerow([rand.choice(players), rand.randint(*YEARS), rand.randint(1, 2),
+                             rand.choice(["BOS", "NYA", "CHN", "LAN"]),
+                             rand.choice(["AL", "NL"]), 100, at_bats, 10, hits, doubles,
+                             triples, home_runs, 1, 1, 1, rand.randint(0, 100), 1, 1, 1,
+                             1, 1, 1])
+    with open(masterfile, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["playerID", "nameFirst", "nameLast"])
+        for player in players:
+            writer.writerow([player, "F" + player, "L" + player])
+    return {"masterfile": masterfile, "battingfile": battingfile,
+            "separator": ",", "quote": '"', "playerid": "playerID",
+            "firstname": "nameFirst", "lastname": "nameLast", "yearid": "yearID",
+            "atbats": "AB", "hits": "H", "doubles": "2B", "triples": "3B",
+            "homeruns": "HR", "walks": "BB",
+            "battingfields": ["AB", "H", "2B", "3B", "HR", "BB"]}
+
+
+##
+## Output normalization
+##
+
+def _ranking(pairs):
+    """
+    Normalizes (player, statistic) pairs to floats.
+    """
+    return [(player, float(stat)) for player, stat in pairs]
+
+
+def _aggregates(aggregated, playerid):
+    """
+    Normalizes aggregated stats (a dictionary or a list of dictionaries)
+    to {player: {field: float}}.
+    """
+    if isinstance(aggregated, dict):
+        aggregated = aggregated.values()
+    return {totals[playerid]: {field: float(value) for field, value in totals.items()
+                               if field != playerid}
+            for totals in aggregated}
+
+
+_TEMPLATE_LINE = re.compile(r"^(-?[\d.]+) --- (.*)$")
+_CODE_LINE = re.compile(r"^(.*) \((-?[\d.]+)\)$")
+
+
+def _top_stats(lines):
+    """
+    Normalizes "x.xxx --- Name" or "Name (x)" strings to (name, statistic)
+    pairs with the statistic rounded to 3 places.
+    """
+    pairs = []
+    for line in lines:
+        match = _TEMPLATE_LINE.match(line)
+        if match:
+            pairs.append((match.group(2), round(float(match.group(1)), 3)))
+            continue
+        match = _CODE_LINE.match(line)
+        if match is None:
+            raise ValueError("unrecognized output line {!r}".format(line))
+        pairs.append((match.group(1), round(float(match.group(2)), 3)))
+    return pairs
+
+
+def rankings_agree(expected, actual):
+    """
+    Returns True if two rankings of (key, statistic) pairs have the same
+    statistics in order and the same keys above the last statistic.
+    """
+    if [stat for _, stat in expected] != [stat for _, stat in actual]:
+        return False
+    if not expected:
+        return True
+    cutoff = expected[-1][1]
+    return ({key for key, stat in expected if stat != cutoff}
+            == {key for key, stat in actual if stat != cutoff})
+
+
+##
+## Adapters: each returns {operation: function(context) -> normalized output}
+##
+
+def _hits(info, row):
+    """Formula of the (info, stats) convention: hits as a float."""
+    return float(row[info["hits"]])
+
+
+def template_adapter(module):
+    """Wraps isp_baseball_template.py, the reference."""
+    return {
+        "filter_by_year": lambda ctx: module.filter_by_year(ctx["rows"], ctx["year"],
+                                                            "yearID"),
+        "top_player_ids": lambda ctx: _ranking(module.top_player_ids(
+            ctx["info"], ctx["year_rows"], _hits, NUM_PLAYERS)),
+        "aggregate_by_player_id": lambda ctx: _aggregates(module.aggregate_by_player_id(
+            ctx["rows"], "playerID", ctx["info"]["battingfields"]), "playerID"),
+        "compute_top_stats_year": lambda ctx: _top_stats(module.compute_top_stats_year(
+            ctx["info"], _hits, NUM_PLAYERS, ctx["year"])),
+        "compute_top_stats_career": lambda ctx: _top_stats(module.compute_top_stats_career(
+            ctx["info"], _hits, NUM_PLAYERS)),
+    }
+
+
+def code_adapter(module):
+    """
+    Wraps code.py or pyton.py, which rank by a field name and accept the
+    info dictionary in place of the master table.
+    """
+    return {
+        "filter_by_year": lambda ctx: module.filter_by_year(ctx["rows"], ctx["year"],
+                                                            "yearID"),
+        "top_player_ids": lambda ctx: _ranking(module.top_player_ids(
+            ctx["year_rows"], "H", NUM_PLAYERS)),
+        "aggregate_by_player_id": lambda ctx: _aggregates(module.aggregate_by_player_id(
+            ctx["rows"], "playerID", ctx["info"]["battingfields"]), "playerID"),
+        "compute_top_stats_year": lambda ctx: _top_stats(module.compute_top_stats_year(
+            ctx["info"], None, ctx["year"], "H", NUM_PLAYERS)),
+        "compute_top_stats_career": lambda ctx: _top_stats(module.compute_top_stats_career(
+            ctx["info"], None, "H", NUM_PLAYERS)),
+    }
+
+
+def player_adapter(module):
+    """
+    Wraps player.py or topplayer.py, whose formulas take only the stats
+    dictionary.  topplayer.py has no filter_by_year.
+    """
+    def hits(row):
+        return float(row["H"])
+
+    operations = {
+        "top_player_ids": lambda ctx: _ranking(module.top_player_ids(
+            ctx["info"], ctx["year_rows"], hits, NUM_PLAYERS)),
+        "aggregate_by_player_id": lambda ctx: _aggregates(module.aggregate_by_player_id(
+            ctx["rows"], "playerID", ctx["info"]["battingfields"]), "playerID"),
+        "compute_top_stats_year": lambda ctx: _top_stats(module.compute_top_stats_year(
+            ctx["info"], hits, NUM_PLAYERS, ctx["year"])),
+        "compute_top_stats_career": lambda ctx: _top_stats(module.compute_top_stats_career(
+            ctx["info"], hits, NUM_PLAYERS)),
+    }
+    if hasattr(module, "filter_by_year"):
+        operations["filter_by_year"] = lambda ctx: module.filter_by_year(
+            ctx["rows"], ctx["year"], "yearID")
+    return operations
+
+
+ADAPTERS = {"isp_baseball_template": template_adapter,
+            "code": code_adapter,
+            "pyton": code_adapter,
+            "player": player_adapter,
+            "topplayer": player_adapter}
+
+
+##
+## Measurement
+##
+
+def _agrees(operation, expected, actual):
+    """
+    Compares a normalized output with the reference output.
+    """
+    if operation == "filter_by_year":
+        return [id(row) for row in expected] == [id(row) for row in actual]
+    if operation == "aggregate_by_player_id":
+        return expected == actual
+    return rankings_agree(expected, actual)
+
+
+def measure(function, context, repeat):
+    """
+    Runs function(context) repeat times.
+
+    Returns:
+        tuple: (result, best seconds, peak traced bytes of the first run).
+    """
+    tracemalloc.start()
+    try:
+        result = function(context)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best, peak
+
+
+def run_matrix(num_rows, repeat, seed, modules=MODULES):
+    """
+    Checks and times every implementation on one generated dataset.
+
+    Returns:
+        list: (operation, module, status, rows per second, peak bytes)
+              tuples, where status is "ok", "DIFF", "missing" or
+              "ERROR: ..." and the numbers are None unless it ran.
+    """
+    implementations = [(name, ADAPTERS[name](load_module(name))) for name in modules]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="baseball-") as directory:
+        info = generate_dataset(directory, num_rows, seed)
+        with open(info["battingfile"], newline="") as csvfile:
+            rows = list(csv.DictReader(csvfile))
+        year = YEARS[1]
+        context = {"info": info, "rows": rows, "year": year,
+                   "year_rows": [row for row in rows if row["yearID"] == str(year)]}
+
+        for operation in OPERATIONS:
+            # top_player_ids only sees the rows of one year.
+            size = len(context["year_rows"]) if operation == "top_player_ids" else num_rows
+            reference = None
+            for name, adapter in implementations:
+                function = adapter.get(operation)
+                if function is None:
+                    results.append((operation, name, "missing", None, None))
+                    continue
+                try:
+                    output, seconds, peak = measure(function, context, repeat)
+                except Exception as error:  # pylint: disable=broad-except
+                    results.append((operation, name,
+                                    "ERROR: {}".format(type(error).__name__), None, None))
+                    continue
+                if reference is None and name == modules[0]:
+                    reference = output
+                status = "ok" if _agrees(operation, reference, output) else "DIFF"
+                results.append((operation, name, status,
+                                size / seconds if seconds else None, peak))
+    return results
+
+
+def format_matrix(results, modules=MODULES):
+    """
+    Formats run_matrix results as a table with one row per operation and
+    one column per implementation.
+    """
+    cells = {}
+    for operation, name, status, rate, peak in results:
+        if rate is None:
+            cells[operation, name] = status
+        else:
+            cells[operation, name] = "{} {:.0f}k r/s {:.1f}MB".format(
+                status, rate / 1000, peak / 1e6)
+    width = max([len(cell) for cell in cells.values()] + [len(name) for name in modules])
+    first = max(len(operation) for operation in OPERATIONS)
+    lines = [" ".join([" " * first] + [name.ljust(width) for name in modules])]
+    for operation in OPERATIONS:
+        lines.append(" ".join([operation.ljust(first)]
+                              + [cells.get((operation, name), "").ljust(width)
+                                 for name in modules]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    Runs the matrix for each requested dataset size and prints the tables.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000],
+                        help="batting rows per generated dataset (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs per measurement (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args(argv)
+
+    for num_rows in args.rows:
+        print("{} batting rows (r/s = input rows per second, MB = peak traced memory)"
+              .format(num_rows))
+        print(format_matrix(run_matrix(num_rows, args.repeat, args.seed)))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
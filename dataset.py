@@ -0,0 +1,743 @@
+"""
+Columnar, dictionary-encoded view of the baseball batting statistics.
+
+A BattingDataset loads info["battingfile"] once with
+project.read_csv_as_columns.  The player ID, year and other repetitive
+string columns are stored as integer codes into a shared vocabulary, so
+equality filters, group-bys and the join with the master file compare
+small integers instead of hashing strings.  Player IDs are only decoded
+back to names for the final output.
+
+The methods mirror the functions in isp_baseball_template.py and return
+the same results, but player IDs in intermediate results are codes.
+Formulas compiled with formula_expr are evaluated a column at a time, and
+load can project the batting file down to the columns they read.  Plain
+formula functions are traced with formula_trace, so the per-row
+dictionaries they receive only carry the fields they use.  Loaded with
+typed=True, numeric columns are parsed once into typed arrays, and blank
+values (common in early seasons) become 0 with a validity bitmap instead
+of crashing the formulas.
+
+derived_columns computes the built-in statistics (AVG, OBP, SLG, OPS) once
+per row and per career, with the MINIMUM_AB rule stored as qualification
+masks; once computed, ranking by a built-in formula reads them instead of
+evaluating it.  load_cached keeps the columns and the derived statistics
+in a cache file, rebuilt when the batting file changes.
+"""
+
+import os
+import pickle
+from array import array
+
+from formula_expr import CompiledFormula, required_columns
+from formula_trace import (DEFAULT_SAMPLE_SIZE, ProjectedRow, cached_trace,
+                           evaluate_projected, formula_columns, read_sample_rows,
+                           trace_formula)
+from isp_baseball_template import MINIMUM_AB, builtin_stat_name
+from project import (is_valid, read_csv_as_columns, read_csv_as_typed_columns,
+                     source_stamp)
+
+# String columns that are dictionary-encoded in addition to the player ID
+# and year columns, when present in the batting file
+DEFAULT_ENCODED_FIELDS = ("teamID", "lgID")
+
+# Built-in statistics kept as derived columns, in the order _derive returns
+DERIVED_STATS = ("AVG", "OBP", "SLG", "OPS")
+
+# Format version of the files written by save
+CACHE_VERSION = 1
+
+
+def _derive(at_bats, hits, doubles, triples, home_runs, walks):
+    """
+    Computes the built-in statistics from float counts with the same
+    arithmetic as the isp_baseball_template formulas, so the results are
+    identical.
+
+    Returns:
+        tuple: (AVG, OBP, SLG, OPS, qualified), where qualified is True if
+               at_bats reaches MINIMUM_AB; otherwise every statistic is 0.
+    """
+    if at_bats < MINIMUM_AB:
+        return 0.0, 0.0, 0.0, 0.0, False
+    onbase = (hits + walks) / (at_bats + walks)
+    singles = hits - doubles - triples - home_runs
+    slugging = (singles + 2 * doubles + 3 * triples + 4 * home_runs) / at_bats
+    return hits / at_bats, onbase, slugging, onbase + slugging, True
+
+
+def _cache_stamp(info):
+    """
+    Returns a value that changes whenever the batting file or the info
+    entries a dataset depends on change.
+    """
+    return (source_stamp(info["battingfile"]), MINIMUM_AB,
+            tuple(sorted((key, value) for key, value in info.items()
+                         if isinstance(value, str))),
+            tuple(info["battingfields"]))
+
+
+class BattingDataset:
+    """
+    Batting statistics held column by column, with repetitive string
+    columns dictionary-encoded.
+    """
+
+    def __init__(self, info, columns, vocabularies, validity=None):
+        """
+        Args:
+            info (dict): Baseball data information dictionary.
+            columns (dict): Maps field names to columns, as returned by
+                            project.read_csv_as_columns.
+            vocabularies (dict): Maps encoded field names to vocabularies.
+            validity (dict): Maps typed numeric field names to validity
+                             bitmaps, as returned by
+                             project.read_csv_as_typed_columns.
+        """
+        self.info = info
+        self.columns = columns
+        self.vocabularies = vocabularies
+        self.validity = {} if validity is None else validity
+        self.playerid = info["playerid"]
+        self.num_rows = len(next(iter(columns.values()), ()))
+        self.projected = False
+        self._code_maps = {}
+        self._player_names = None
+        self._year_index = None
+        self._season_totals = {}
+        self._derived = None
+
+    @classmethod
+    def load(cls, info, encode=None, fields=None, typed=False, derived=False):
+        """
+        Loads the batting file named by info.
+
+        Args:
+            info (dict): Baseball data information dictionary.
+            encode (list): Fields to dictionary-encode.  Defaults to the
+                           player ID and year fields plus
+                           DEFAULT_ENCODED_FIELDS.
+            fields (list): Optional columns to load, e.g. the
+                           required_columns of the compiled formulas to be
+                           run.  The player ID and year columns are always
+                           loaded.  Defaults to every column.
+            typed (bool): If True, numeric columns are parsed once into
+                          typed arrays, with blanks stored as 0 and
+                          recorded in validity bitmaps, so formulas and
+                          aggregations never see strings or blanks.
+                          Otherwise every column holds strings.
+            derived (bool): If True, compute the derived statistic columns
+                            (see derived_columns) right away.
+
+        Returns:
+            BattingDataset: The loaded dataset.
+        """
+        if encode is None:
+            encode = (info["playerid"], info["yearid"]) + DEFAULT_ENCODED_FIELDS
+        if fields is not None:
+            fields = set(fields) | {info["playerid"], info["yearid"]}
+        if typed:
+            columns, vocabularies, validity = read_csv_as_typed_columns(
+                info["battingfile"], info["separator"], info["quote"], fields=fields,
+                encode=encode)
+            data = cls(info, columns, vocabularies, validity)
+        else:
+            columns, vocabularies = read_csv_as_columns(info["battingfile"],
+                                                        info["separator"], info["quote"],
+                                                        fields=fields, encode=encode)
+            data = cls(info, columns, vocabularies)
+        data.projected = fields is not None
+        if derived:
+            data.derived_columns()
+        return data
+
+    @classmethod
+    def load_cached(cls, info, cache_file, typed=False, derived=True):
+        """
+        Loads the dataset from a cache file written by save, or from the
+        batting file if the cache is missing or stale, in which case the
+        cache is rewritten.
+
+        The cache holds the columns together with the derived statistic
+        columns, so both are invalidated together when the batting file,
+        the info field names or MINIMUM_AB change.
+
+        Args:
+            info (dict): Baseball data information dictionary.
+            cache_file (str): The cache file.
+            typed (bool): Whether to parse numeric columns, as for load.
+            derived (bool): Whether to compute and store the derived
+                            columns.
+
+        Returns:
+            BattingDataset: The loaded dataset.
+        """
+        stamp = (_cache_stamp(info), typed)
+        try:
+            with open(cache_file, "rb") as cache:
+                state = pickle.load(cache)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            state = None
+        if (isinstance(state, dict) and state.get("version") == CACHE_VERSION
+                and state.get("stamp") == stamp
+                and (state["derived"] is not None or not derived)):
+            data = cls(info, state["columns"], state["vocabularies"], state["validity"])
+            data._derived = state["derived"]
+            return data
+
+        data = cls.load(info, typed=typed, derived=derived)
+        data.save(cache_file, typed)
+        return data
+
+    def save(self, cache_file, typed=False):
+        """
+        Writes the dataset, including any derived columns, to a cache file
+        for load_cached.  The file is replaced atomically.
+
+        Args:
+            cache_file (str): The cache file.
+            typed (bool): Whether the dataset was loaded with typed=True.
+        """
+        state = {"version": CACHE_VERSION,
+                 "stamp": (_cache_stamp(self.info), typed),
+                 "columns": self.columns,
+                 "vocabularies": self.vocabularies,
+                 "validity": self.validity,
+                 "derived": self._derived}
+        temporary = cache_file + ".tmp"
+        with open(temporary, "wb") as cache:
+            pickle.dump(state, cache, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_file)
+
+    @classmethod
+    def load_for(cls, info, formulas, encode=None, typed=False):
+        """
+        Loads only the batting columns that the given formulas read.
+
+        Compiled formulas report their columns directly; formula functions
+        are traced on the first rows of the batting file.  If a function
+        reads whole rows, every column is loaded.
+
+        Args:
+            info (dict): Baseball data information dictionary.
+            formulas (list): Formula functions and/or CompiledFormulas.
+            encode (list): Fields to dictionary-encode, as for load.
+            typed (bool): Whether to parse numeric columns, as for load.
+
+        Returns:
+            BattingDataset: The loaded dataset.
+        """
+        compiled = [formula for formula in formulas if isinstance(formula, CompiledFormula)]
+        functions = [formula for formula in formulas
+                     if not isinstance(formula, CompiledFormula)]
+        fields = required_columns(compiled)
+        if functions:
+            traced = formula_columns(functions, info, read_sample_rows(info))
+            fields = None if traced is None else fields | traced
+        return cls.load(info, encode, fields, typed)
+
+    def where(self, **conditions):
+        """
+        Starts a lazy query on this dataset with equality filters, e.g.
+        data.where(year=2010).score(formula).top(10).names().  See query.py.
+        """
+        from query import Query
+
+        return Query(self.info, self).where(**conditions)
+
+    def encode(self, field, value):
+        """
+        Returns the code of a string value in an encoded column, or None if
+        the value does not occur in the column.
+        """
+        codes = self._code_maps.get(field)
+        if codes is None:
+            codes = {value: code for code, value in enumerate(self.vocabularies[field])}
+            self._code_maps[field] = codes
+        return codes.get(value)
+
+    def decode(self, field, code):
+        """
+        Returns the string value of a code in an encoded column.
+        """
+        return self.vocabularies[field][code]
+
+    def column_values(self, field, rows):
+        """
+        Returns the values of a column in the given rows, decoding
+        dictionary-encoded fields to their strings, so that the result
+        holds what read_csv_as_list_dict rows would.
+        """
+        column = self.columns[field]
+        vocabulary = self.vocabularies.get(field)
+        if vocabulary is None:
+            return [column[index] for index in rows]
+        return [vocabulary[column[index]] for index in rows]
+
+    def is_null(self, field, index):
+        """
+        Returns True if a typed numeric field was blank in row index.
+        Untyped columns hold the original strings, so blanks there are
+        empty strings instead.
+        """
+        validity = self.validity.get(field)
+        return validity is not None and not is_valid(validity, index)
+
+    def row(self, index, fields=None):
+        """
+        Returns row index as a dictionary of string values, like a row of
+        read_csv_as_list_dict.  If fields is given, only those fields are
+        included and the row is a formula_trace.ProjectedRow, which raises
+        UntracedField when any other field is read.  So are the full rows
+        of a dataset loaded with only some fields.
+        """
+        if fields is None and not self.projected:
+            return self._fill_row({}, index)
+        return self._fill_row(ProjectedRow(), index, fields)
+
+    def _fill_row(self, row, index, fields=None):
+        """
+        Stores the values of row index in a dictionary and returns it.
+        """
+        columns = self.columns
+        for field in columns if fields is None else fields:
+            column = columns[field]
+            vocabulary = self.vocabularies.get(field)
+            value = column[index]
+            row[field] = vocabulary[value] if vocabulary is not None else value
+        return row
+
+    def filter_equal(self, field, value, rows=None):
+        """
+        Selects the rows whose field equals value.
+
+        Args:
+            field (str): The field to compare.
+            value (str): The string value to match.
+            rows (list): Optional row indices to filter.  Defaults to all.
+
+        Returns:
+            list: Indices of the matching rows, in order.
+        """
+        column = self.columns[field]
+        if field in self.vocabularies:
+            value = self.encode(field, value)
+            if value is None:
+                return []
+        if rows is None:
+            return [index for index, item in enumerate(column) if item == value]
+        return [index for index in rows if column[index] == value]
+
+    def filter_by_year(self, year, rows=None):
+        """
+        Selects the rows from the given year.
+
+        Args:
+            year (int): Year to filter by.
+            rows (list): Optional row indices to filter.  Defaults to all.
+
+        Returns:
+            list: Indices of the rows from that year, in order.
+        """
+        return self.filter_equal(self.info["yearid"], str(year), rows)
+
+    def year_index(self):
+        """
+        Groups the rows by year, in one pass over the year column.
+
+        Returns:
+            dict: Maps each year (as a string, in order of first appearance)
+                  to the list of its row indices, in order.  The index is
+                  built once and cached.
+        """
+        if self._year_index is None:
+            yearid = self.info["yearid"]
+            years = self.vocabularies[yearid]
+            groups = [[] for _ in years]
+            for index, code in enumerate(self.columns[yearid]):
+                groups[code].append(index)
+            self._year_index = dict(zip(years, groups))
+        return self._year_index
+
+    def derived_columns(self):
+        """
+        Computes the built-in statistics once per row and once per career.
+
+        Returns:
+            dict: {"rows": {stat: array of per-row values},
+                   "row_qualified": bytearray, 1 for rows with at least
+                                    MINIMUM_AB at bats,
+                   "career_order": player codes in order of first
+                                   appearance,
+                   "careers": {stat: array of per-career values aligned
+                               with career_order},
+                   "career_qualified": bytearray aligned with
+                                       career_order}
+            Statistics are the DERIVED_STATS, with the values the
+            isp_baseball_template formulas compute (0 when not qualified).
+            Blank counts are taken as 0, as in typed datasets.  The result
+            is kept, and stored by save.
+        """
+        if self._derived is not None:
+            return self._derived
+        info = self.info
+        keys = ("atbats", "hits", "doubles", "triples", "homeruns", "walks")
+        columns = [self.columns[info[key]] for key in keys]
+
+        # Career totals are summed here rather than with
+        # aggregate_by_player_id, so blanks cannot break them either; the
+        # counts are integers, so float sums are exact.
+        players = self.columns[self.playerid]
+        career_totals = [None] * len(self.vocabularies[self.playerid])
+        career_order = array("i")
+        row_stats = {stat: array("d") for stat in DERIVED_STATS}
+        row_appends = [row_stats[stat].append for stat in DERIVED_STATS]
+        row_qualified = bytearray()
+        positions = range(len(keys))
+        for code, counts in zip(players, zip(*columns)):
+            counts = [float(count or 0) for count in counts]
+            values = _derive(*counts)
+            for append, value in zip(row_appends, values):
+                append(value)
+            row_qualified.append(values[4])
+            totals = career_totals[code]
+            if totals is None:
+                career_totals[code] = counts
+                career_order.append(code)
+            else:
+                for position in positions:
+                    totals[position] += counts[position]
+
+        career_stats = {stat: array("d") for stat in DERIVED_STATS}
+        career_appends = [career_stats[stat].append for stat in DERIVED_STATS]
+        career_qualified = bytearray()
+        for code in career_order:
+            values = _derive(*career_totals[code])
+            for append, value in zip(career_appends, values):
+                append(value)
+            career_qualified.append(values[4])
+
+        self._derived = {"rows": row_stats,
+                         "row_qualified": row_qualified,
+                         "career_order": career_order,
+                         "careers": career_stats,
+                         "career_qualified": career_qualified}
+        return self._derived
+
+    def qualified_rows(self, rows=None):
+        """
+        Selects the rows with at least MINIMUM_AB at bats, using the
+        precomputed qualification mask.
+
+        Args:
+            rows (list): Optional row indices to filter.  Defaults to all.
+
+        Returns:
+            list: Indices of the qualified rows, in order.
+        """
+        mask = self.derived_columns()["row_qualified"]
+        if rows is None:
+            rows = range(self.num_rows)
+        return [index for index in rows if mask[index]]
+
+    def _derived_stat(self, formula):
+        """
+        Returns the name of a built-in formula if its derived columns have
+        been computed, otherwise None.
+        """
+        if self._derived is None:
+            return None
+        return builtin_stat_name(formula)
+
+    def top_player_ids(self, formula, numplayers, rows=None):
+        """
+        Ranks rows by a formula.
+
+        Args:
+            formula (function): Takes an info dictionary and a batting
+                                statistics dictionary and computes a
+                                compound statistic, or a CompiledFormula,
+                                which is evaluated column by column.
+            numplayers (int): Number of top players to return, or None
+                              for all of them.
+            rows (list): Optional row indices to rank.  Defaults to all.
+
+        Returns:
+            list: (player code, statistic) tuples for the top numplayers
+                  rows, in decreasing order of the statistic.
+        """
+        if rows is None:
+            rows = range(self.num_rows)
+        players = self.columns[self.playerid]
+        stat = self._derived_stat(formula)
+        if stat is not None:
+            # Read the precomputed statistic instead of evaluating.
+            column = self._derived["rows"][stat]
+            scores = [(players[index], column[index]) for index in rows]
+        elif isinstance(formula, CompiledFormula):
+            columns = {field: self.column_values(field, rows) for field in formula.columns}
+            values = formula.evaluate(columns, len(rows))
+            scores = list(zip([players[index] for index in rows], values))
+        else:
+            info = self.info
+            fields = self.traced_fields(formula)
+            if fields is None:
+                values = [formula(info, self.row(index)) for index in rows]
+            else:
+                values = evaluate_projected(formula, info,
+                                            (self.row(index, fields) for index in rows),
+                                            lambda: (self.row(index) for index in rows))
+            scores = list(zip([players[index] for index in rows], values))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:numplayers]
+
+    def traced_fields(self, formula):
+        """
+        Returns the loaded fields a formula function reads, traced on the
+        first rows of the dataset, or None if it reads whole rows.
+        """
+        dependencies = cached_trace(formula, self.info)
+        if dependencies is None:
+            sample = [self._fill_row({}, index)
+                      for index in range(min(DEFAULT_SAMPLE_SIZE, self.num_rows))]
+            dependencies = trace_formula(formula, self.info, sample)
+        if dependencies.columns is None:
+            return None
+        return [field for field in self.columns if field in dependencies.columns]
+
+    def aggregate_by_player_id(self, fields, rows=None):
+        """
+        Sums fields per player.
+
+        Args:
+            fields (list): Fields to aggregate.
+            rows (list): Optional row indices to aggregate.  Defaults to all.
+
+        Returns:
+            dict: Maps player codes, in order of first appearance, to
+                  dictionaries of aggregated stats for the given fields.
+        """
+        return self.aggregate_by(self.playerid, fields, rows)
+
+    def aggregate_by(self, group_field, fields, rows=None):
+        """
+        Sums fields per value of an encoded column, such as the player ID or
+        teamID.
+
+        Codes index a list directly, so grouping needs no hashing.
+
+        Args:
+            group_field (str): The dictionary-encoded field to group by.
+            fields (list): Fields to aggregate.
+            rows (list): Optional row indices to aggregate.  Defaults to all.
+
+        Returns:
+            dict: Maps group codes, in order of first appearance, to
+                  dictionaries of aggregated stats for the given fields.
+        """
+        if rows is None:
+            rows = range(self.num_rows)
+        groups = self.columns[group_field]
+        field_columns = [self.columns[field] for field in fields]
+        positions = range(len(fields))
+
+        totals = [None] * len(self.vocabularies[group_field])
+        order = []
+        for index in rows:
+            code = groups[index]
+            group_totals = totals[code]
+            if group_totals is None:
+                group_totals = totals[code] = [0] * len(fields)
+                order.append(code)
+            for position in positions:
+                # Blanks count as 0; typed columns are summed as they
+                # are, and only untyped strings are parsed.
+                value = field_columns[position][index] or 0
+                if value.__class__ is str:
+                    value = int(value)
+                group_totals[position] += value
+
+        return {code: dict(zip(fields, totals[code])) for code in order}
+
+    def _names(self):
+        """
+        Joins the master file to the player codes, once.
+
+        Returns:
+            list: Player names ("FirstName LastName") indexed by player code,
+                  with None for players missing from the master file.
+        """
+        if self._player_names is None:
+            info = self.info
+            columns, _ = read_csv_as_columns(info["masterfile"], info["separator"],
+                                             info["quote"],
+                                             fields=(info["playerid"], info["firstname"],
+                                                     info["lastname"]))
+            names = [None] * len(self.vocabularies[self.playerid])
+            for player, first, last in zip(columns[info["playerid"]],
+                                           columns[info["firstname"]],
+                                           columns[info["lastname"]]):
+                code = self.encode(self.playerid, player)
+                if code is not None:
+                    names[code] = "{} {}".format(first, last)
+            self._player_names = names
+        return self._player_names
+
+    def player_name(self, code):
+        """
+        Returns the "FirstName LastName" of a player code.
+
+        Raises:
+            KeyError: If the player is missing from the master file.
+        """
+        name = self._names()[code]
+        if name is None:
+            raise KeyError(self.decode(self.playerid, code))
+        return name
+
+    def lookup_player_names(self, top_codes_and_stats):
+        """
+        Decodes player codes into formatted output.
+
+        Args:
+            top_codes_and_stats (list): (player code, statistic) tuples.
+
+        Returns:
+            list: Strings of the form "x.xxx --- FirstName LastName".
+        """
+        return ["{:.3f} --- {}".format(stat, self.player_name(code))
+                for code, stat in top_codes_and_stats]
+
+    def compute_top_stats_year(self, formula, numplayers, year):
+        """
+        Returns a list of strings for the top numplayers in the given year
+        according to the given formula.
+        """
+        rows = self.year_index().get(str(year), [])
+        return self.lookup_player_names(self.top_player_ids(formula, numplayers, rows))
+
+    def compute_top_stats_career(self, formula, numplayers):
+        """
+        Returns a list of strings for the top numplayers in their careers
+        according to the given formula.
+        """
+        top_codes_and_stats = self.rank_totals(formula, numplayers,
+                                                self.aggregate_by_player_id)
+        return self.lookup_player_names(top_codes_and_stats)
+
+    def compute_top_stats_season(self, formula, numplayers, year):
+        """
+        Returns a list of strings for the top numplayers in the given year
+        according to the given formula, applied to each player's season
+        totals rather than to individual stints.
+        """
+        top_codes_and_stats = self.rank_totals(
+            formula, numplayers, lambda fields: self.season_totals(fields).get(str(year), {}))
+        return self.lookup_player_names(top_codes_and_stats)
+
+    def season_totals(self, fields=None):
+        """
+        Sums fields per (year, player) for every year in one sweep, so a
+        player with several stints in a season gets a single row of season
+        totals.
+
+        Each (year, player) pair is fused into one integer key, so grouping
+        hashes a small int per row.  Results are cached per list of fields.
+
+        Args:
+            fields (list): Fields to aggregate.  Defaults to
+                           info["battingfields"].  Subsets of the batting
+                           fields share the batting fields' sweep, so their
+                           totals may include the other batting fields too.
+
+        Returns:
+            dict: Maps each year (as a string) to a dictionary mapping
+                  player codes, in order of first appearance that year, to
+                  dictionaries of season totals.
+        """
+        battingfields = self.info["battingfields"]
+        if fields is None or set(fields) <= set(battingfields):
+            fields = battingfields
+        fields = tuple(fields)
+        cached = self._season_totals.get(fields)
+        if cached is not None:
+            return cached
+
+        yearid = self.info["yearid"]
+        years = self.columns[yearid]
+        players = self.columns[self.playerid]
+        num_players = len(self.vocabularies[self.playerid])
+        field_columns = [self.columns[field] for field in fields]
+        positions = range(len(fields))
+
+        slots = {}
+        for index in range(self.num_rows):
+            key = years[index] * num_players + players[index]
+            totals = slots.get(key)
+            if totals is None:
+                totals = slots[key] = [0] * len(fields)
+            for position in positions:
+                # Blanks count as 0; typed columns are summed as they
+                # are, and only untyped strings are parsed.
+                value = field_columns[position][index] or 0
+                if value.__class__ is str:
+                    value = int(value)
+                totals[position] += value
+
+        year_names = self.vocabularies[yearid]
+        by_year = {}
+        for key, totals in slots.items():
+            year_code, code = divmod(key, num_players)
+            by_year.setdefault(year_names[year_code], {})[code] = dict(zip(fields, totals))
+
+        self._season_totals[fields] = by_year
+        return by_year
+
+    def rank_totals(self, formula, numplayers, aggregate):
+        """
+        Ranks per-player totals by a formula.
+
+        Args:
+            formula: A formula function or CompiledFormula.
+            numplayers (int): Number of top players to return, or None
+                              for all of them.
+            aggregate (function): Takes a list of fields and returns a
+                                  dictionary mapping player codes to
+                                  dictionaries of totals of those fields.
+
+        Returns:
+            list: (player code, statistic) tuples for the top numplayers,
+                  in decreasing order of the statistic.
+        """
+        info = self.info
+        stat = self._derived_stat(formula)
+        if stat is not None and aggregate == self.aggregate_by_player_id:
+            scores = list(zip(self._derived["career_order"], self._derived["careers"][stat]))
+        elif isinstance(formula, CompiledFormula):
+            fields = sorted(formula.columns)
+            for field in fields:
+                if field not in info["battingfields"]:
+                    # Totals only hold the batting fields, as in
+                    # isp_baseball_template (summing the codes of an
+                    # encoded field such as yearID would be meaningless).
+                    raise KeyError(field)
+            totals = aggregate(fields)
+            columns = {field: [stats[field] for stats in totals.values()]
+                       for field in fields}
+            values = formula.evaluate(columns, len(totals))
+            scores = list(zip(totals, values))
+        else:
+            # Only aggregate the fields the formula is traced to read.
+            fields = self.traced_fields(formula)
+            if fields is None:
+                scores = [(code, formula(info, stats))
+                          for code, stats in aggregate(info["battingfields"]).items()]
+            else:
+                totals = aggregate([field for field in info["battingfields"]
+                                    if field in fields])
+                values = evaluate_projected(
+                    formula, info, totals.values(),
+                    lambda: aggregate(info["battingfields"]).values())
+                scores = list(zip(totals, values))
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:numplayers]
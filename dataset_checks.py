@@ -0,0 +1,150 @@
+"""
+Edge-case checks of BattingDataset against isp_baseball_template.
+
+Each check writes a small generated batting file (see
+compare_implementations.generate_dataset), possibly edited to hold the
+edge case, and compares what the dataset computes with the reference
+functions.  A check returns a list of problem descriptions, empty if the
+results agree.
+
+Usage:
+    python dataset_checks.py [--rows N] [--seed S]
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+
+import isp_baseball_template as template
+from compare_implementations import generate_dataset
+from dataset import BattingDataset
+from formula_expr import compile_formula
+from query import scan
+
+# Compiled formulas reading dictionary-encoded columns
+ENCODED_FORMULAS = ("H where yearID >= 2000",
+                    "H where yearID >= 2000 and yearID != 2005",
+                    "yearID - 1990 + H / 1000")
+
+
+def check_encoded_predicates(info):
+    """
+    Checks that compiled formulas reading encoded columns (yearID) rank
+    rows like the template, which sees the column's strings.
+    """
+    problems = []
+    rows = template.read_csv_as_list_dict(info["battingfile"], info["separator"],
+                                          info["quote"])
+    data = BattingDataset.load(info)
+    for text in ENCODED_FORMULAS:
+        formula = compile_formula(text, info)
+        expected = template.top_player_ids(info, rows, formula, 10)
+        actual = [(data.decode(data.playerid, code), stat)
+                  for code, stat in data.top_player_ids(formula, 10)]
+        if actual != expected:
+            problems.append("{!r}: top_player_ids {} != {}".format(text, actual, expected))
+        expected = template.compute_top_stats_year(info, formula, 10, 2005, profile=False)
+        if data.compute_top_stats_year(formula, 10, 2005) != expected:
+            problems.append("{!r}: compute_top_stats_year differs".format(text))
+        if scan(info).where(year=2005).score(formula).top(10).names() != expected:
+            problems.append("{!r}: Query differs".format(text))
+    return problems
+
+
+def _edit_counts(info):
+    """
+    Writes a copy of the batting file in which every seventh HR is blank
+    and every fifth BB is a float, and returns (info for the copy, expected
+    totals).  The expected totals map (year, player ID) to [HR, BB] sums,
+    with blanks counted as 0.
+    """
+    filename = os.path.join(os.path.dirname(info["battingfile"]), "EditedBatting.csv")
+    expected = {}
+    with open(info["battingfile"], newline="") as source, \
+            open(filename, "w", newline="") as target:
+        reader = csv.DictReader(source, delimiter=info["separator"],
+                                quotechar=info["quote"])
+        writer = csv.DictWriter(target, reader.fieldnames, delimiter=info["separator"],
+                                quotechar=info["quote"])
+        writer.writeheader()
+        for index, row in enumerate(reader):
+            if index % 7 == 0:
+                row["HR"] = ""
+            if index % 5 == 0:
+                row["BB"] += ".5"
+            writer.writerow(row)
+            totals = expected.setdefault((row[info["yearid"]], row[info["playerid"]]), [0, 0])
+            totals[0] += float(row["HR"] or 0)
+            totals[1] += float(row["BB"])
+    return dict(info, battingfile=filename), expected
+
+
+def check_blank_and_float_counts(info):
+    """
+    Checks that aggregate_by_player_id and season_totals count blanks as 0
+    and sum float columns without truncating them.  Untyped datasets hold
+    the float BB values as strings, which are rejected as in the template,
+    so only HR is summed there.
+    """
+    problems = []
+    info, expected = _edit_counts(info)
+    careers = {}
+    for (_, player), totals in expected.items():
+        career = careers.setdefault(player, [0, 0])
+        career[0] += totals[0]
+        career[1] += totals[1]
+    for typed in (False, True):
+        data = BattingDataset.load(info, typed=typed)
+        fields = ["HR", "BB"] if typed else ["HR"]
+        actual = {data.decode(data.playerid, code): [totals[field] for field in fields]
+                  for code, totals in data.aggregate_by_player_id(fields).items()}
+        if actual != {player: totals[:len(fields)] for player, totals in careers.items()}:
+            problems.append("typed={}: aggregate_by_player_id differs".format(typed))
+        if not typed:
+            continue
+        actual = {(year, data.decode(data.playerid, code)): [totals["HR"], totals["BB"]]
+                  for year, players in data.season_totals(fields).items()
+                  for code, totals in players.items()}
+        if actual != expected:
+            problems.append("typed={}: season_totals differs".format(typed))
+    return problems
+
+
+CHECKS = (check_encoded_predicates, check_blank_and_float_counts)
+
+
+def run_checks(num_rows=2000, seed=1):
+    """
+    Runs every check on a generated dataset.
+
+    Returns:
+        list: (check name, problem) tuples; empty if every check passed.
+    """
+    problems = []
+    with tempfile.TemporaryDirectory(prefix="baseball-") as directory:
+        info = generate_dataset(directory, num_rows, seed)
+        for check in CHECKS:
+            problems.extend((check.__name__, problem) for problem in check(info))
+    return problems
+
+
+def main(argv=None):
+    """
+    Runs the checks from the command line.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=2000,
+                        help="batting rows in the generated dataset (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args(argv)
+
+    problems = run_checks(args.rows, args.seed)
+    for name, problem in problems:
+        print("{}: {}".format(name, problem))
+    print("{} checks, {} problems".format(len(CHECKS), len(problems)))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,28 @@
 """
 This module provides functions for comparing two text files line by line
 and formatting their differences.
+
+It also provides a key-aware diff for CSV files, which matches rows by a
+(possibly composite) key instead of by line number, and a directory-level
+diff that only compares files whose content hashes differ.  For reordered
+files, edit_script interns lines to integer IDs and reports moved blocks as
+moves rather than as matching deletes and inserts.
 """
 
+import difflib
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, zip_longest
+
+from project import iter_csv_keyed_rows
+
+# Number of deleted runs examined as move candidates for each inserted line
+MAX_MOVE_CANDIDATES = 32
+
+
 def get_file_lines(filename):
     """
     Reads a file and returns its lines as a list of strings.
@@ -107,13 +127,180 @@ def multiline_diff(lines1, lines2):
     return diffs
 
 
-def file_diff_format(filename1, filename2):
+def intern_lines(*line_lists):
+    """
+    Maps lines to small integer IDs using one table shared by all inputs,
+    so that equal lines in any of the inputs get the same ID.
+
+    Args:
+        *line_lists (list): Lists of strings (lines).
+
+    Returns:
+        tuple: (id_lists, table) where id_lists holds one list of integer IDs
+               per input and table maps each distinct line to its ID.
+    """
+    table = {}
+    id_lists = []
+    for lines in line_lists:
+        ids = []
+        for line in lines:
+            line_id = table.get(line)
+            if line_id is None:
+                line_id = len(table)
+                table[line] = line_id
+            ids.append(line_id)
+        id_lists.append(ids)
+    return id_lists, table
+
+
+def _runs(mask):
+    """
+    Returns the (start, end) ranges of consecutive True entries in mask.
+    """
+    runs = []
+    start = None
+    for idx, flag in enumerate(mask):
+        if flag and start is None:
+            start = idx
+        elif not flag and start is not None:
+            runs.append((start, idx))
+            start = None
+    if start is not None:
+        runs.append((start, len(mask)))
+    return runs
+
+
+def _script_from_opcodes(ids1, ids2, opcodes, min_move_length):
+    """
+    Turns SequenceMatcher opcodes over interned lines into an edit script,
+    pairing deleted and inserted runs with identical IDs into moves.
+    See edit_script for the format of the result.
+    """
+    deleted = [False] * len(ids1)
+    inserted = [False] * len(ids2)
+    for tag, start1, end1, start2, end2 in opcodes:
+        if tag in ('replace', 'delete'):
+            deleted[start1:end1] = [True] * (end1 - start1)
+        if tag in ('replace', 'insert'):
+            inserted[start2:end2] = [True] * (end2 - start2)
+
+    # Index the runs of deleted lines by their first min_move_length IDs
+    # (each anchor maps to an insertion-ordered dict used as a set), then
+    # greedily pair each inserted line with the longest deleted run among
+    # the first candidates sharing its anchor.  Bounding the candidates
+    # keeps repeated lines (such as blank ones) from making the pairing
+    # quadratic.
+    width = max(min_move_length, 1)
+    anchors = {}
+    for start, end in _runs(deleted):
+        for idx in range(start, end - width + 1):
+            anchors.setdefault(tuple(ids1[idx:idx + width]), {})[idx] = None
+
+    moved = []
+    idx2 = 0
+    while idx2 < len(ids2):
+        if not inserted[idx2]:
+            idx2 += 1
+            continue
+        best_start, best_length = None, 0
+        candidates = anchors.get(tuple(ids2[idx2:idx2 + width]), ())
+        for idx1 in islice(candidates, MAX_MOVE_CANDIDATES):
+            length = 0
+            while (idx1 + length < len(ids1) and idx2 + length < len(ids2)
+                   and deleted[idx1 + length] and inserted[idx2 + length]
+                   and ids1[idx1 + length] == ids2[idx2 + length]):
+                length += 1
+            if length > best_length:
+                best_start, best_length = idx1, length
+        if best_length >= min_move_length:
+            moved.append((best_start, best_start + best_length, idx2, idx2 + best_length))
+            for offset in range(best_length):
+                deleted[best_start + offset] = False
+                inserted[idx2 + offset] = False
+            # Drop the anchors overlapping the paired lines.
+            for idx1 in range(max(best_start - width + 1, 0), best_start + best_length):
+                anchors.get(tuple(ids1[idx1:idx1 + width]), {}).pop(idx1, None)
+            idx2 += best_length
+        else:
+            idx2 += 1
+
+    return {'deleted': _runs(deleted), 'inserted': _runs(inserted), 'moved': moved}
+
+
+def edit_script(lines1, lines2, min_move_length=2):
+    """
+    Computes a line-level edit script between two lists of lines, reporting
+    blocks that were moved as moves instead of as deletes plus inserts.
+
+    The lines are interned once with intern_lines and the diff itself runs
+    over the resulting integer arrays, so no string is compared more than
+    once.
+
+    Args:
+        lines1 (list): The first list of strings (lines).
+        lines2 (list): The second list of strings (lines).
+        min_move_length (int): Shortest run of lines reported as a move.
+                               Shorter matches stay deletes and inserts.
+
+    Returns:
+        dict: A dictionary with three entries, all using 0-indexed,
+              half-open line ranges:
+              'deleted'  - list of (start1, end1) ranges only in lines1,
+              'inserted' - list of (start2, end2) ranges only in lines2,
+              'moved'    - list of (start1, end1, start2, end2) tuples for
+                           blocks that appear in both at different places.
+              All lists are empty if the inputs are identical.
+    """
+    (ids1, ids2), _ = intern_lines(lines1, lines2)
+    matcher = difflib.SequenceMatcher(None, ids1, ids2, autojunk=False)
+    return _script_from_opcodes(ids1, ids2, matcher.get_opcodes(), min_move_length)
+
+
+def edit_script_format(lines1, lines2, min_move_length=2):
+    """
+    Formats the edit script between two lists of lines.
+
+    Args:
+        lines1 (list): The first list of strings (lines).
+        lines2 (list): The second list of strings (lines).
+        min_move_length (int): Shortest run of lines reported as a move.
+
+    Returns:
+        str: A formatted string with one entry per moved, deleted or
+             inserted block, or an empty string if the inputs are identical.
+    """
+    script = edit_script(lines1, lines2, min_move_length)
+    return _format_edit_script(script, lines1, lines2)
+
+
+def _format_edit_script(script, lines1, lines2):
+    """
+    Formats an edit script produced by edit_script.
+    """
+    formatted_diff_parts = []
+    for start1, end1, start2, end2 in script['moved']:
+        formatted_diff_parts.append(
+            f"Moved lines {start1}-{end1 - 1} to {start2}-{end2 - 1}")
+    for start1, end1 in script['deleted']:
+        body = "\n".join("- " + line for line in lines1[start1:end1])
+        formatted_diff_parts.append(f"Deleted lines {start1}-{end1 - 1}:\n{body}")
+    for start2, end2 in script['inserted']:
+        body = "\n".join("+ " + line for line in lines2[start2:end2])
+        formatted_diff_parts.append(f"Inserted lines {start2}-{end2 - 1}:\n{body}")
+
+    return "\n".join(formatted_diff_parts)
+
+
+def file_diff_format(filename1, filename2, detect_moves=False):
     """
     Compares two files and returns a formatted string of their differences.
 
     Args:
         filename1 (str): The path to the first file.
         filename2 (str): The path to the second file.
+        detect_moves (bool): If True, report moved, deleted and inserted
+                             blocks using edit_script_format instead of
+                             comparing the files line by line.
 
     Returns:
         str: A formatted string showing all differences, or an empty string
@@ -122,6 +309,9 @@ def file_diff_format(filename1, filename2):
     lines1 = get_file_lines(filename1)
     lines2 = get_file_lines(filename2)
 
+    if detect_moves:
+        return edit_script_format(lines1, lines2)
+
     # If there was an error reading a file, get_file_lines would return [],
     # and multiline_diff will still work correctly.
     
@@ -145,3 +335,427 @@ def file_diff_format(filename1, filename2):
 
     # Join all the formatted parts with a newline for separation.
     return "\n".join(formatted_diff_parts)
+
+
+def _intern_against(table, lines):
+    """
+    Maps lines to IDs using an existing intern table without modifying it.
+    Lines missing from the table get fresh IDs numbered after it.
+    """
+    extra = {}
+    ids = []
+    for line in lines:
+        line_id = table.get(line)
+        if line_id is None:
+            line_id = extra.setdefault(line, len(table) + len(extra))
+        ids.append(line_id)
+    return ids
+
+
+class DiffBaseline:
+    """
+    A baseline file that is read and indexed once and then diffed against
+    any number of candidate files.
+
+    The baseline lines are interned, and a SequenceMatcher per worker thread
+    keeps the baseline as its cached second sequence, so the anchor index
+    over the baseline is built once rather than per candidate.  Each
+    candidate is then read, interned against the baseline table and
+    compared, with work proportional to the candidate.
+    """
+
+    def __init__(self, filename):
+        """
+        Args:
+            filename (str): The path to the baseline file.
+        """
+        self.filename = filename
+        self.lines = get_file_lines(filename)
+        (self.ids,), self.table = intern_lines(self.lines)
+        self._local = threading.local()
+
+    def _matcher(self):
+        """
+        Returns this thread's SequenceMatcher with the baseline preloaded.
+        """
+        matcher = getattr(self._local, 'matcher', None)
+        if matcher is None:
+            matcher = difflib.SequenceMatcher(None, autojunk=False)
+            matcher.set_seq2(self.ids)
+            self._local.matcher = matcher
+        return matcher
+
+    def edit_script(self, lines, min_move_length=2):
+        """
+        Computes the edit script from the baseline to a list of lines.
+
+        Args:
+            lines (list): The candidate lines.
+            min_move_length (int): Shortest run of lines reported as a move.
+
+        Returns:
+            dict: An edit script in the format returned by edit_script, with
+                  the baseline as the first input.
+        """
+        ids = _intern_against(self.table, lines)
+        if ids == self.ids:
+            return {'deleted': [], 'inserted': [], 'moved': []}
+        matcher = self._matcher()
+        matcher.set_seq1(ids)
+        # The candidate is the matcher's first sequence, so swap the roles
+        # of the two sides to express the opcodes from the baseline.
+        swap = {'delete': 'insert', 'insert': 'delete'}
+        opcodes = [(swap.get(tag, tag), start2, end2, start1, end1)
+                   for tag, start1, end1, start2, end2 in matcher.get_opcodes()]
+        return _script_from_opcodes(self.ids, ids, opcodes, min_move_length)
+
+    def diff_format(self, filename, detect_moves=False):
+        """
+        Compares the baseline with a candidate file.
+
+        Args:
+            filename (str): The path to the candidate file.
+            detect_moves (bool): If True, report moved, deleted and inserted
+                                 blocks instead of line-by-line differences.
+
+        Returns:
+            str: The same string as file_diff_format(baseline, filename).
+                 With detect_moves, an equivalent edit script; lines with
+                 several equally good alignments may be paired differently.
+        """
+        lines = get_file_lines(filename)
+        if detect_moves:
+            script = self.edit_script(lines)
+            return _format_edit_script(script, self.lines, lines)
+        if lines == self.lines:
+            return ""
+
+        formatted_diff_parts = []
+        for line_num, line1, line2 in multiline_diff(self.lines, lines):
+            diff_index = singleline_diff(line1, line2)
+            formatted_lines = singleline_diff_format(line1, line2, diff_index)
+            formatted_diff_parts.append(f"Line {line_num}:\n" + formatted_lines)
+        return "\n".join(formatted_diff_parts)
+
+    def diff_many(self, filenames, detect_moves=False, max_workers=None):
+        """
+        Compares the baseline with many candidate files.
+
+        Args:
+            filenames (list): Paths of the candidate files.
+            detect_moves (bool): Passed on to diff_format.
+            max_workers (int): Number of worker threads.  If 1, candidates
+                               are diffed sequentially.
+
+        Returns:
+            dict: Maps each candidate path to its diff_format output.
+        """
+        if max_workers == 1:
+            return {name: self.diff_format(name, detect_moves) for name in filenames}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda name: self.diff_format(name, detect_moves),
+                                   filenames)
+            return dict(zip(filenames, results))
+
+
+def _compare_rows(row1, row2):
+    """
+    Compares two CSV rows field by field.
+
+    Args:
+        row1 (dict): The row from the first file.
+        row2 (dict): The row from the second file.
+
+    Returns:
+        dict: Maps each differing field name to an (old, new) tuple.
+              A field missing from one of the rows is reported as None.
+    """
+    changes = {}
+    for field, value1 in row1.items():
+        value2 = row2.get(field)
+        if value1 != value2:
+            changes[field] = (value1, value2)
+    for field, value2 in row2.items():
+        if field not in row1:
+            changes[field] = (None, value2)
+    return changes
+
+
+def csv_diff(filename1, filename2, keyfield, separator=',', quote='"'):
+    """
+    Compares two CSV files row by row, matching rows by key.
+
+    Both files are streamed in lockstep.  A row whose key has not yet been
+    seen in the other file is parked in a pending index; it is removed as
+    soon as its partner turns up.  For files that are mostly in the same
+    order, memory use is therefore proportional to the number of changed
+    (or displaced) rows rather than to the size of the files.
+
+    Args:
+        filename1 (str): The path to the old CSV file.
+        filename2 (str): The path to the new CSV file.
+        keyfield (str or list): The key column, or a list of columns forming
+                                a composite key such as
+                                ['playerID', 'yearID', 'stint'].
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+
+    Returns:
+        dict: A dictionary with three entries:
+              'added'   - dict mapping keys to rows only in filename2,
+              'removed' - dict mapping keys to rows only in filename1,
+              'changed' - list of (key, changes) tuples, where changes maps
+                          each differing field to an (old, new) tuple.
+
+    Raises:
+        ValueError: If a key occurs twice in the same file while its first
+                    row is still unmatched, or in consecutive rows, since
+                    its rows could not be matched unambiguously.  Keys are
+                    not remembered once matched, so a duplicate of a row
+                    that was already paired is reported as added or
+                    removed instead; for sorted files, every duplicate is
+                    consecutive and therefore rejected.
+    """
+    pending1 = {}
+    pending2 = {}
+    changed = []
+    previous = [None, None]
+
+    def check_unique(key, side, own_pending, filename):
+        """Rejects a key repeating the previous or an unmatched row's key."""
+        if key == previous[side] or key in own_pending:
+            raise ValueError("duplicate key {!r} in {}".format(_format_key(key), filename))
+        previous[side] = key
+
+    def match(key, row, own_pending, other_pending, old_first):
+        """Pairs a row with its partner if it has already been seen."""
+        other = other_pending.pop(key, None)
+        if other is None:
+            own_pending[key] = row
+            return
+        old_row, new_row = (other, row) if not old_first else (row, other)
+        changes = _compare_rows(old_row, new_row)
+        if changes:
+            changed.append((key, changes))
+
+    stream1 = iter_csv_keyed_rows(filename1, keyfield, separator, quote)
+    stream2 = iter_csv_keyed_rows(filename2, keyfield, separator, quote)
+    for item1, item2 in zip_longest(stream1, stream2):
+        if item1 is not None:
+            check_unique(item1[0], 0, pending1, filename1)
+        if item2 is not None:
+            check_unique(item2[0], 1, pending2, filename2)
+        if item1 is not None and item2 is not None and item1[0] == item2[0]:
+            # Fast path: both files are aligned at this row.
+            changes = _compare_rows(item1[1], item2[1])
+            if changes:
+                changed.append((item1[0], changes))
+            continue
+        if item1 is not None:
+            match(item1[0], item1[1], pending1, pending2, True)
+        if item2 is not None:
+            match(item2[0], item2[1], pending2, pending1, False)
+
+    return {'added': pending2, 'removed': pending1, 'changed': changed}
+
+
+def _format_key(key):
+    """
+    Formats a (possibly composite) row key for display.
+    """
+    if isinstance(key, tuple):
+        return "/".join(key)
+    return key
+
+
+def csv_diff_format(filename1, filename2, keyfield, separator=',', quote='"'):
+    """
+    Compares two CSV files by key and returns a formatted report.
+
+    Args:
+        filename1 (str): The path to the old CSV file.
+        filename2 (str): The path to the new CSV file.
+        keyfield (str or list): The key column, or a list of key columns.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+
+    Returns:
+        str: A formatted string listing removed, added and changed rows,
+             or an empty string if the files hold the same rows.
+    """
+    result = csv_diff(filename1, filename2, keyfield, separator, quote)
+
+    formatted_diff_parts = []
+    for key in result['removed']:
+        formatted_diff_parts.append(f"Removed {_format_key(key)}")
+    for key in result['added']:
+        formatted_diff_parts.append(f"Added {_format_key(key)}")
+    for key, changes in result['changed']:
+        lines = [f"Changed {_format_key(key)}:"]
+        for field, (old, new) in changes.items():
+            lines.append(f"  {field}: {old!r} -> {new!r}")
+        formatted_diff_parts.append("\n".join(lines))
+
+    return "\n".join(formatted_diff_parts)
+
+
+def hash_file(filename, chunk_size=1 << 20):
+    """
+    Computes a content hash of a file, reading it in chunks.
+
+    Args:
+        filename (str): The path to the file.
+        chunk_size (int): Number of bytes to read at a time.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as file_handle:
+        for chunk in iter(lambda: file_handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_hash_cache(cache_file):
+    """
+    Loads a persistent hash cache written by save_hash_cache.
+
+    Args:
+        cache_file (str): The path to the JSON cache file.
+
+    Returns:
+        dict: Maps absolute file paths to [size, mtime_ns, digest] entries.
+              Returns an empty dictionary if the cache is missing or corrupt.
+    """
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file_handle:
+            cache = json.load(file_handle)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_hash_cache(cache_file, cache):
+    """
+    Writes a hash cache to disk, replacing the previous one atomically.
+
+    Args:
+        cache_file (str): The path to the JSON cache file.
+        cache (dict): The cache, as returned by load_hash_cache.
+    """
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file_handle:
+        json.dump(cache, file_handle)
+    os.replace(temp_file, cache_file)
+
+
+def hash_tree(directory, cache=None, max_workers=None):
+    """
+    Computes content hashes for every file under a directory.
+
+    A file whose (path, size, mtime) matches a cache entry reuses the cached
+    hash; all other files are hashed on a thread pool and the cache is
+    updated in place.
+
+    Args:
+        directory (str): The root directory.
+        cache (dict): Optional hash cache, as returned by load_hash_cache.
+        max_workers (int): Number of hashing threads (default: executor's).
+
+    Returns:
+        dict: Maps paths relative to directory (using '/' separators) to
+              content hashes.
+    """
+    if cache is None:
+        cache = {}
+
+    hashes = {}
+    to_hash = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, directory).replace(os.sep, '/')
+            stat = os.stat(path)
+            abspath = os.path.abspath(path)
+            entry = cache.get(abspath)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                hashes[relpath] = entry[2]
+            else:
+                to_hash.append((relpath, abspath, stat))
+
+    if to_hash:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            digests = executor.map(hash_file, [item[1] for item in to_hash])
+            for (relpath, abspath, stat), digest in zip(to_hash, digests):
+                hashes[relpath] = digest
+                cache[abspath] = [stat.st_size, stat.st_mtime_ns, digest]
+
+    return hashes
+
+
+def tree_diff(directory1, directory2, cache_file=None, max_workers=None):
+    """
+    Compares two directory trees file by file.
+
+    Files are matched by relative path and compared by content hash; the
+    line-level diff from file_diff_format only runs on files whose hashes
+    differ.
+
+    Args:
+        directory1 (str): The old directory.
+        directory2 (str): The new directory.
+        cache_file (str): Optional path of a persistent hash cache, so that
+                          unchanged files are not re-read on later runs.
+        max_workers (int): Number of hashing threads.
+
+    Returns:
+        dict: A dictionary with three entries:
+              'added'   - sorted list of relative paths only in directory2,
+              'removed' - sorted list of relative paths only in directory1,
+              'changed' - dict mapping relative paths of files present in
+                          both trees with different content to the output
+                          of file_diff_format.
+    """
+    cache = load_hash_cache(cache_file) if cache_file else {}
+    hashes1 = hash_tree(directory1, cache, max_workers)
+    hashes2 = hash_tree(directory2, cache, max_workers)
+    if cache_file:
+        save_hash_cache(cache_file, cache)
+
+    added = sorted(set(hashes2) - set(hashes1))
+    removed = sorted(set(hashes1) - set(hashes2))
+    changed = {}
+    for relpath in sorted(set(hashes1) & set(hashes2)):
+        if hashes1[relpath] != hashes2[relpath]:
+            changed[relpath] = file_diff_format(os.path.join(directory1, relpath),
+                                                os.path.join(directory2, relpath))
+
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+
+def tree_diff_format(directory1, directory2, cache_file=None, max_workers=None):
+    """
+    Compares two directory trees and returns a formatted report.
+
+    Args:
+        directory1 (str): The old directory.
+        directory2 (str): The new directory.
+        cache_file (str): Optional path of a persistent hash cache.
+        max_workers (int): Number of hashing threads.
+
+    Returns:
+        str: A formatted string listing removed, added and changed files,
+             or an empty string if the trees are identical.
+    """
+    result = tree_diff(directory1, directory2, cache_file, max_workers)
+
+    formatted_diff_parts = []
+    for relpath in result['removed']:
+        formatted_diff_parts.append(f"Removed {relpath}")
+    for relpath in result['added']:
+        formatted_diff_parts.append(f"Added {relpath}")
+    for relpath, file_diff in result['changed'].items():
+        formatted_diff_parts.append(f"Changed {relpath}:\n{file_diff}")
+
+    return "\n".join(formatted_diff_parts)
@@ -0,0 +1,224 @@
+"""
+Out-of-core aggregation of batting statistics under a memory budget.
+
+isp_baseball_template.aggregate_by_player_id keeps one totals dictionary
+per player in memory.  The functions here accept a stream of rows and keep
+at most memory_budget bytes (estimated) of partial totals.  When the budget
+is exceeded, the partial totals are hash-partitioned by player ID to
+temporary spill files and cleared.  Each partition is then aggregated
+separately (repartitioned again if it still does not fit), written out in
+order of first appearance, and the partitions are merged.
+
+Every partial total carries the index of the player's first row, so the
+merged output is in the same order, and has the same totals, as the
+in-memory aggregate_by_player_id.  If the totals fit in the budget no file
+is written at all.
+"""
+
+import csv
+import heapq
+import os
+import sys
+import tempfile
+
+from isp_baseball_template import lookup_player_names
+from project import open_csv_source
+
+# Default budget for partial totals held in memory, in bytes
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# Number of spill files the totals are hash-partitioned into
+DEFAULT_PARTITIONS = 16
+
+# Repartitioning depth after which a partition is aggregated in memory
+# regardless of the budget (e.g. if one player's totals exceed it)
+MAX_DEPTH = 4
+
+# Estimated bytes of dictionary slot overhead per entry
+_SLOT_OVERHEAD = 100
+
+
+def _entry_size(player, num_fields):
+    """
+    Estimates the memory used by one player's partial totals.
+    """
+    return (_SLOT_OVERHEAD + sys.getsizeof(player)
+            + sys.getsizeof([0] * (num_fields + 1)) + 32 * (num_fields + 1))
+
+
+class _Spiller:
+    """
+    Hash-partitioned spill files of (first row, player, totals...) lines.
+    """
+
+    def __init__(self, directory, num_partitions, salt):
+        self.directory = directory
+        self.num_partitions = num_partitions
+        self.salt = salt
+        self.files = [None] * num_partitions
+        self.writers = [None] * num_partitions
+        self.paths = [None] * num_partitions
+
+    def write(self, partial):
+        """
+        Appends partial totals, a dictionary mapping players to
+        [first row, total, ...] lists, to the partition files.
+        """
+        for player, entry in partial.items():
+            partition = hash((self.salt, player)) % self.num_partitions
+            writer = self.writers[partition]
+            if writer is None:
+                handle, path = tempfile.mkstemp(prefix="spill-", suffix=".csv",
+                                                dir=self.directory)
+                spill_file = os.fdopen(handle, "w", newline="")
+                self.files[partition] = spill_file
+                self.paths[partition] = path
+                writer = self.writers[partition] = csv.writer(spill_file)
+            writer.writerow([entry[0], player] + entry[1:])
+
+    def close(self):
+        """
+        Closes the files and returns the paths of the non-empty partitions.
+        """
+        for spill_file in self.files:
+            if spill_file is not None:
+                spill_file.close()
+        return [path for path in self.paths if path is not None]
+
+
+def _read_partials(path):
+    """
+    Yields (first row, player, totals) from a spill or result file.
+    """
+    with open(path, "r", newline="") as spill_file:
+        for record in csv.reader(spill_file):
+            yield int(record[0]), record[1], [int(value) for value in record[2:]]
+
+
+def _aggregate(partials, num_fields, memory_budget, directory, num_partitions, depth):
+    """
+    Sums partial totals per player within the memory budget.
+
+    Args:
+        partials (iterable): (first row, player, totals) tuples, in order of
+                             first row within each player.
+        num_fields (int): Number of totals per entry.
+        memory_budget (int): Estimated bytes of totals to hold at once.
+        directory (str): Directory for spill files.
+        num_partitions (int): Number of partitions to spill to.
+        depth (int): Repartitioning depth.
+
+    Yields:
+        tuple: (first row, player, totals) for every player, in increasing
+               order of first row.
+    """
+    totals = {}
+    used = 0
+    spiller = None
+    for first, player, values in partials:
+        entry = totals.get(player)
+        if entry is None:
+            totals[player] = [first] + values
+            used += _entry_size(player, num_fields)
+            if used > memory_budget and depth < MAX_DEPTH:
+                if spiller is None:
+                    spiller = _Spiller(directory, num_partitions, depth)
+                spiller.write(totals)
+                totals = {}
+                used = 0
+        else:
+            if first < entry[0]:
+                entry[0] = first
+            for position, value in enumerate(values, 1):
+                entry[position] += value
+
+    if spiller is None:
+        for player, entry in sorted(totals.items(), key=lambda item: item[1][0]):
+            yield entry[0], player, entry[1:]
+        return
+
+    spiller.write(totals)
+    totals = None
+    results = []
+    try:
+        for path in spiller.close():
+            # Aggregate each partition on its own and write it out in order.
+            handle, result_path = tempfile.mkstemp(prefix="part-", suffix=".csv",
+                                                   dir=directory)
+            results.append(result_path)
+            with os.fdopen(handle, "w", newline="") as result_file:
+                writer = csv.writer(result_file)
+                for first, player, values in _aggregate(_read_partials(path), num_fields,
+                                                        memory_budget, directory,
+                                                        num_partitions, depth + 1):
+                    writer.writerow([first, player] + values)
+            os.remove(path)
+        for partial in heapq.merge(*[_read_partials(path) for path in results],
+                                   key=lambda item: item[0]):
+            yield partial
+    finally:
+        for path in results:
+            os.remove(path)
+
+
+def iter_aggregates(statistics, playerid, fields, memory_budget=DEFAULT_MEMORY_BUDGET,
+                    num_partitions=DEFAULT_PARTITIONS, directory=None):
+    """
+    Sums fields per player, spilling to disk beyond a memory budget.
+
+    Args:
+        statistics (iterable): Batting statistics dictionaries; consumed one
+                               at a time, so a streaming reader can be used.
+        playerid (str): Player ID field name.
+        fields (list): Fields to aggregate.
+        memory_budget (int): Estimated bytes of totals to hold in memory.
+        num_partitions (int): Number of spill partitions.
+        directory (str): Directory for spill files.  Defaults to the
+                         system temporary directory.
+
+    Yields:
+        dict: One aggregated stats dictionary per player, holding the
+              player ID and the totals of fields, in order of each
+              player's first row.
+    """
+    partials = ((index, row[playerid], [int(row[field]) for field in fields])
+                for index, row in enumerate(statistics))
+    with tempfile.TemporaryDirectory(prefix="aggregate-", dir=directory) as spill_dir:
+        for _, player, values in _aggregate(partials, len(fields), memory_budget,
+                                            spill_dir, num_partitions, 0):
+            totals = {playerid: player}
+            totals.update(zip(fields, values))
+            yield totals
+
+
+def aggregate_by_player_id(statistics, playerid, fields,
+                           memory_budget=DEFAULT_MEMORY_BUDGET,
+                           num_partitions=DEFAULT_PARTITIONS, directory=None):
+    """
+    Returns the same nested dictionary as
+    isp_baseball_template.aggregate_by_player_id, computed with
+    iter_aggregates so that partial totals beyond memory_budget are spilled
+    to disk.
+    """
+    return {totals[playerid]: totals
+            for totals in iter_aggregates(statistics, playerid, fields, memory_budget,
+                                          num_partitions, directory)}
+
+
+def compute_top_stats_career(info, formula, numplayers,
+                             memory_budget=DEFAULT_MEMORY_BUDGET, directory=None):
+    """
+    Returns a list of strings for the top numplayers in their careers
+    according to the given formula, like
+    isp_baseball_template.compute_top_stats_career, streaming the batting
+    file and aggregating it within memory_budget.  Only the top numplayers
+    career totals are kept.
+    """
+    with open_csv_source(info["battingfile"]) as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=info["separator"],
+                                quotechar=info["quote"])
+        careers = iter_aggregates(reader, info["playerid"], info["battingfields"],
+                                  memory_budget, directory=directory)
+        scores = ((totals[info["playerid"]], formula(info, totals)) for totals in careers)
+        top_ids_and_stats = heapq.nlargest(numplayers, scores, key=lambda item: item[1])
+    return lookup_player_names(info, top_ids_and_stats)
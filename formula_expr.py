@@ -0,0 +1,405 @@
+"""
+A small expression language for batting formulas.
+
+A formula such as
+
+    (H + BB) / (AB + BB) where AB >= 500
+
+is compiled once into an expression tree.  The tree names exactly the
+columns the formula reads, so a loader can project only those columns, and
+it is evaluated a whole column at a time instead of row by row.
+
+Syntax:
+    formula    := expression ['where' condition]
+    expression := arithmetic with + - * / and unary -, numbers, column
+                  names (e.g. H, 2B) and parentheses
+    condition  := comparisons (< <= > >= == !=) combined with and, or, not
+
+Names are looked up in the info dictionary first, so "hits / atbats" works
+with any info that maps "hits" and "atbats" to column names.  Division by
+zero yields 0, a row that fails the where condition scores 0 (like the
+MINIMUM_AB rule of the built-in formulas), and blank values count as 0.
+
+Identical sub-expressions compile to equal (hashable) tree nodes, so
+evaluate_many computes a sub-expression shared by several formulas, such
+as the on-base percentage inside OPS, only once.
+"""
+
+import operator
+import re
+
+from isp_baseball_template import MINIMUM_AB
+
+# Sub-expressions of the built-in formulas, written against info keys
+_OBP = "(hits + walks) / (atbats + walks)"
+_SLG = ("(hits - doubles - triples - homeruns + 2 * doubles + 3 * triples"
+        " + 4 * homeruns) / atbats")
+_QUALIFIED = "where atbats >= {}".format(MINIMUM_AB)
+
+# Expression versions of isp_baseball_template.FORMULAS
+BUILTIN_EXPRESSIONS = {"AVG": "hits / atbats " + _QUALIFIED,
+                       "OBP": _OBP + " " + _QUALIFIED,
+                       "SLG": _SLG + " " + _QUALIFIED,
+                       "OPS": _OBP + " + " + _SLG + " " + _QUALIFIED}
+
+_TOKEN_RE = re.compile(r"""
+      (?P<number>\d+\.\d*|\.\d+|\d+(?![A-Za-z_]))
+    | (?P<name>[A-Za-z_0-9]+)
+    | (?P<op><=|>=|==|!=|[-+*/()<>])
+    """, re.VERBOSE)
+
+_KEYWORDS = ("and", "or", "not", "where")
+
+_COMPARISONS = ("<", "<=", ">", ">=", "==", "!=")
+
+# Operators whose operands may be swapped without changing the result;
+# their operands are put in a canonical order so equal sub-expressions
+# written in a different order are shared too.
+_COMMUTATIVE = ("+", "*", "==", "!=", "and", "or")
+
+
+def _divide(numerator, denominator):
+    """
+    Divides, returning 0 for a zero denominator.
+    """
+    return numerator / denominator if denominator else 0.0
+
+
+_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": _divide,
+              "<": operator.lt, "<=": operator.le, ">": operator.gt,
+              ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+              "and": lambda left, right: bool(left and right),
+              "or": lambda left, right: bool(left or right)}
+
+
+def _tokenize(text):
+    """
+    Splits formula text into (kind, value) tokens.
+
+    Raises:
+        ValueError: On a character that cannot start a token.
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        if text[position].isspace():
+            position += 1
+            continue
+        match = _TOKEN_RE.match(text, position)
+        if match is None:
+            raise ValueError("unexpected {!r} at position {} in formula {!r}".format(
+                text[position], position, text))
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "name" and value in _KEYWORDS:
+            kind = "op"
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser producing expression tree tuples:
+    ("num", value), ("col", name), ("neg", operand), ("not", operand),
+    (op, left, right) and ("where", value, condition).
+    """
+
+    def __init__(self, text, info):
+        self.text = text
+        self.info = info or {}
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def error(self, message):
+        """Raises a ValueError naming the formula."""
+        raise ValueError("{} in formula {!r}".format(message, self.text))
+
+    def peek(self):
+        """Returns the next token value, or None at the end."""
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return None
+
+    def take(self):
+        """Consumes and returns the next token."""
+        if self.position >= len(self.tokens):
+            self.error("unexpected end")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def binary(self, op, left, right):
+        """Builds a binary node, canonicalizing commutative operators."""
+        if op in _COMMUTATIVE and repr(right) < repr(left):
+            left, right = right, left
+        return (op, left, right)
+
+    def parse_formula(self):
+        """formula := or_expr ['where' or_expr]"""
+        value = self.parse_or()
+        if self.peek() == "where":
+            self.take()
+            condition = self.parse_or()
+            self.check(condition, True)
+            value = ("where", value, condition)
+        if self.peek() is not None:
+            self.error("unexpected {!r}".format(self.peek()))
+        self.check(value, False)
+        return value
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == "or":
+            self.take()
+            node = self.binary("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == "and":
+            self.take()
+            node = self.binary("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == "not":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        node = self.parse_sum()
+        if self.peek() in _COMPARISONS:
+            op = self.take()[1]
+            node = self.binary(op, node, self.parse_sum())
+        return node
+
+    def parse_sum(self):
+        node = self.parse_product()
+        while self.peek() in ("+", "-"):
+            op = self.take()[1]
+            node = self.binary(op, node, self.parse_product())
+        return node
+
+    def parse_product(self):
+        node = self.parse_unary()
+        while self.peek() in ("*", "/"):
+            op = self.take()[1]
+            node = self.binary(op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.parse_unary())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind == "number":
+            return ("num", float(value))
+        if kind == "name":
+            column = self.info.get(value, value)
+            if not isinstance(column, str):
+                column = value
+            return ("col", column)
+        if value == "(":
+            node = self.parse_or()
+            if self.peek() != ")":
+                self.error("missing ')'")
+            self.take()
+            return node
+        self.error("unexpected {!r}".format(value))
+        return None
+
+    def check(self, node, boolean):
+        """
+        Checks that node is a condition (boolean True) or a number.
+        """
+        kind = node[0]
+        is_boolean = kind in _COMPARISONS or kind in ("and", "or", "not")
+        if is_boolean != boolean:
+            self.error("expected a {}".format("condition" if boolean else "number"))
+        if kind in ("and", "or"):
+            self.check(node[1], True)
+            self.check(node[2], True)
+        elif kind == "not":
+            self.check(node[1], True)
+        elif kind in _COMPARISONS or kind in ("+", "-", "*", "/"):
+            self.check(node[1], False)
+            self.check(node[2], False)
+        elif kind == "neg":
+            self.check(node[1], False)
+        elif kind == "where":
+            self.check(node[1], False)
+
+
+def _columns_of(node, found):
+    """
+    Adds the column names read by node to found.
+    """
+    if node[0] == "col":
+        found.add(node[1])
+    elif node[0] != "num":
+        for child in node[1:]:
+            _columns_of(child, found)
+    return found
+
+
+def to_number(value):
+    """
+    Converts a raw CSV value to a float, treating blanks as 0.
+    """
+    if value is None or value == "":
+        return 0.0
+    return float(value)
+
+
+def _broadcast(func, left, right):
+    """
+    Applies a binary function to two operands, each a list of per-row
+    values or a single scalar shared by every row.
+    """
+    left_list = isinstance(left, list)
+    right_list = isinstance(right, list)
+    if left_list and right_list:
+        return [func(x, y) for x, y in zip(left, right)]
+    if left_list:
+        return [func(x, right) for x in left]
+    if right_list:
+        return [func(left, y) for y in right]
+    return func(left, right)
+
+
+def _evaluate(node, columns, cache):
+    """
+    Evaluates node a column at a time.
+
+    Args:
+        node (tuple): The expression tree node.
+        columns (dict): Maps column names to lists of raw values.
+        cache (dict): Maps already evaluated nodes to their results.
+
+    Returns:
+        A list with one value per row, or a scalar if the node does not
+        depend on any column.
+    """
+    result = cache.get(node)
+    if result is not None:
+        return result
+
+    kind = node[0]
+    if kind == "num":
+        result = node[1]
+    elif kind == "col":
+        result = [to_number(value) for value in columns[node[1]]]
+    elif kind == "neg":
+        operand = _evaluate(node[1], columns, cache)
+        result = [-x for x in operand] if isinstance(operand, list) else -operand
+    elif kind == "not":
+        operand = _evaluate(node[1], columns, cache)
+        result = [not x for x in operand] if isinstance(operand, list) else not operand
+    elif kind == "where":
+        values = _evaluate(node[1], columns, cache)
+        condition = _evaluate(node[2], columns, cache)
+        result = _broadcast(lambda value, keep: value if keep else 0.0, values, condition)
+    else:
+        result = _broadcast(_OPERATORS[kind], _evaluate(node[1], columns, cache),
+                            _evaluate(node[2], columns, cache))
+
+    cache[node] = result
+    return result
+
+
+class CompiledFormula:
+    """
+    A compiled formula expression.
+
+    Instances can be called like the formula functions of
+    isp_baseball_template.py, formula(info, batting_stats), and also
+    evaluated over whole columns with evaluate.
+    """
+
+    def __init__(self, text, info=None):
+        """
+        Compiles formula text.
+
+        Args:
+            text (str): The formula, e.g. "(H + BB) / (AB + BB) where AB >= 500".
+            info (dict): Optional baseball data information dictionary used
+                         to resolve names such as "hits" to column names.
+
+        Raises:
+            ValueError: If the text is not a valid formula.
+        """
+        self.text = text
+        self.tree = _Parser(text, info).parse_formula()
+        self.columns = frozenset(_columns_of(self.tree, set()))
+
+    def __repr__(self):
+        return "CompiledFormula({!r})".format(self.text)
+
+    def evaluate(self, columns, num_rows=None, cache=None):
+        """
+        Evaluates the formula over columns of raw values.
+
+        Args:
+            columns (dict): Maps at least self.columns to equal-length
+                            lists of values (strings or numbers).
+            num_rows (int): Number of rows; only needed when the formula
+                            reads no columns.
+            cache (dict): Optional cache of evaluated sub-expressions shared
+                          with other formulas over the same columns.
+
+        Returns:
+            list: One float per row.
+        """
+        result = _evaluate(self.tree, columns, {} if cache is None else cache)
+        if isinstance(result, list):
+            return result
+        if num_rows is None:
+            num_rows = len(next(iter(columns.values()), ()))
+        return [float(result)] * num_rows
+
+    def __call__(self, info, batting_stats):
+        """
+        Evaluates the formula for a single batting statistics dictionary.
+        """
+        columns = {column: [batting_stats[column]] for column in self.columns}
+        return self.evaluate(columns, 1)[0]
+
+
+def compile_formula(text, info=None):
+    """
+    Compiles formula text into a CompiledFormula.
+    """
+    return CompiledFormula(text, info)
+
+
+def required_columns(formulas):
+    """
+    Returns the set of columns read by any of the compiled formulas.
+    """
+    columns = set()
+    for formula in formulas:
+        columns |= formula.columns
+    return columns
+
+
+def evaluate_many(formulas, columns, num_rows=None):
+    """
+    Evaluates several compiled formulas over the same columns, computing
+    each shared sub-expression once.
+
+    Args:
+        formulas (list): CompiledFormula objects.
+        columns (dict): Maps column names to lists of raw values.
+        num_rows (int): Number of rows; only needed when no formula reads
+                        any column.
+
+    Returns:
+        list: One list of per-row results for each formula, in order.
+    """
+    cache = {}
+    return [formula.evaluate(columns, num_rows, cache) for formula in formulas]
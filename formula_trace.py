@@ -0,0 +1,282 @@
+"""
+Column-usage tracing for formula functions.
+
+Formulas such as isp_baseball_template.onbase_percentage are plain Python
+functions of (info, batting_stats), so which columns they read cannot be
+seen from outside.  trace_formula runs a formula on a few sample rows
+wrapped in recording dictionaries and notes every info key and every
+batting statistics field it reads.  The result is cached per formula, so
+a loader can read, and build per-row dictionaries from, only those fields
+without any change to the formula.
+
+Formulas that look at every field (by iterating over the row or calling
+keys, values or items) are reported with columns None, meaning that no
+projection is possible.
+
+A trace only sees the branches the sample rows take, so projected rows are
+passed to formulas as ProjectedRows: reading a field that was not traced
+raises UntracedField instead of quietly returning a default, and
+evaluate_projected then evaluates the formula on full rows instead.
+"""
+
+import csv
+import weakref
+from collections import namedtuple
+from itertools import islice
+
+from project import open_csv_source
+
+# Number of rows a formula is traced against by default.  Several rows are
+# used so that branches taken only for some rows (such as the MINIMUM_AB
+# check) are exercised too.
+DEFAULT_SAMPLE_SIZE = 50
+
+# The info keys and batting statistics fields read by a formula; columns is
+# None if the formula reads the whole row.
+Dependencies = namedtuple("Dependencies", ["info_keys", "columns"])
+
+# Maps formulas to (info signature, Dependencies), without keeping
+# formulas alive
+_TRACE_CACHE = weakref.WeakKeyDictionary()
+
+
+class UntracedField(KeyError):
+    """
+    Raised when a formula reads a field missing from a ProjectedRow.
+    """
+
+
+class ProjectedRow(dict):
+    """
+    A batting statistics dictionary holding only some fields.  Reading any
+    other field, by indexing, get or in, or reading the whole row raises
+    UntracedField and sets missed, so that a projection can never change a
+    result, even if the formula catches the error.
+    """
+
+    missed = False
+
+    def _miss(self, key):
+        self.missed = True
+        raise UntracedField(key)
+
+    def __getitem__(self, key):
+        if not super().__contains__(key):
+            self._miss(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        return self[key]
+
+    def __contains__(self, key):
+        if not super().__contains__(key):
+            self._miss(key)
+        return True
+
+    def __iter__(self):
+        self._miss(None)
+
+    def __len__(self):
+        self._miss(None)
+
+    def keys(self):
+        self._miss(None)
+
+    def values(self):
+        self._miss(None)
+
+    def items(self):
+        self._miss(None)
+
+
+class _RecordingInfo(dict):
+    """
+    An info dictionary that records which keys are read.
+    """
+
+    def __init__(self, info, accessed):
+        super().__init__(info)
+        self.accessed = accessed
+
+    def __getitem__(self, key):
+        self.accessed.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed.add(key)
+        return super().get(key, default)
+
+
+class _RecordingStats(dict):
+    """
+    A batting statistics dictionary that records which fields are read.
+    A read of the whole row sets whole_row[0] to True.
+    """
+
+    def __init__(self, row, accessed, whole_row):
+        super().__init__(row)
+        self.accessed = accessed
+        self.whole_row = whole_row
+
+    def __getitem__(self, key):
+        self.accessed.add(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed.add(key)
+        return super().get(key, default)
+
+    def __contains__(self, key):
+        self.accessed.add(key)
+        return super().__contains__(key)
+
+    def _read_all(self):
+        self.whole_row[0] = True
+
+    def __iter__(self):
+        self._read_all()
+        return super().__iter__()
+
+    def keys(self):
+        self._read_all()
+        return super().keys()
+
+    def values(self):
+        self._read_all()
+        return super().values()
+
+    def items(self):
+        self._read_all()
+        return super().items()
+
+
+def _info_signature(info):
+    """
+    Returns a hashable summary of the field names an info dictionary maps
+    to, so a cached trace is only reused with compatible info.
+    """
+    return tuple(sorted((key, value) for key, value in info.items()
+                        if isinstance(value, str)))
+
+
+def read_sample_rows(info, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    Reads the first rows of info["battingfile"] for tracing.
+
+    Returns:
+        list: Up to sample_size row dictionaries.
+    """
+    with open_csv_source(info["battingfile"]) as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=info["separator"],
+                                quotechar=info["quote"])
+        return list(islice(reader, sample_size))
+
+
+def trace_formula(formula, info, sample_rows):
+    """
+    Discovers the info keys and fields a formula reads.
+
+    The formula is run once per sample row; the union of what it reads is
+    returned and cached, so later calls with the same formula and
+    compatible info do not run it again.  Sample rows on which the formula
+    raises an exception are skipped.
+
+    Args:
+        formula (function): Takes an info dictionary and a batting
+                            statistics dictionary and computes a compound
+                            statistic.
+        info (dict): Baseball data information dictionary.
+        sample_rows (list): Batting statistics dictionaries to trace with.
+
+    Returns:
+        Dependencies: The info keys and the fields read (or None for the
+                      fields if the formula reads the whole row).
+    """
+    cached = cached_trace(formula, info)
+    if cached is not None:
+        return cached
+
+    info_keys = set()
+    columns = set()
+    whole_row = [False]
+    recording_info = _RecordingInfo(info, info_keys)
+    for row in sample_rows:
+        try:
+            formula(recording_info, _RecordingStats(row, columns, whole_row))
+        except Exception:  # pylint: disable=broad-except
+            # A failing sample still tells us what was read up to the error.
+            continue
+
+    dependencies = Dependencies(frozenset(info_keys),
+                                None if whole_row[0] else frozenset(columns))
+    try:
+        _TRACE_CACHE[formula] = (_info_signature(info), dependencies)
+    except TypeError:
+        # Some callables (such as builtins) cannot be weakly referenced.
+        pass
+    return dependencies
+
+
+def cached_trace(formula, info):
+    """
+    Returns the cached Dependencies of a formula for compatible info, or
+    None if it has not been traced.
+    """
+    try:
+        cached = _TRACE_CACHE.get(formula)
+    except TypeError:
+        return None
+    if cached is not None and cached[0] == _info_signature(info):
+        return cached[1]
+    return None
+
+
+def formula_columns(formulas, info, sample_rows):
+    """
+    Returns the fields read by any of the formulas, or None if one of them
+    reads the whole row.
+    """
+    columns = set()
+    for formula in formulas:
+        dependencies = trace_formula(formula, info, sample_rows)
+        if dependencies.columns is None:
+            return None
+        columns |= dependencies.columns
+    return columns
+
+
+def evaluate_projected(formula, info, projected_rows, full_rows):
+    """
+    Applies a formula to projected rows, falling back to full rows if it
+    reads a field outside the projection.
+
+    Args:
+        formula (function): The formula to apply.
+        info (dict): Baseball data information dictionary.
+        projected_rows (iterable): Dictionaries (or ProjectedRows) holding
+                                   the traced fields.
+        full_rows (function): Returns an iterable of the full rows, in the
+                              same order; only called on a fallback.
+
+    Returns:
+        list: The formula's value for each row.
+    """
+    values = []
+    append = values.append
+    for row in projected_rows:
+        if not isinstance(row, ProjectedRow):
+            row = ProjectedRow(row)
+        try:
+            append(formula(info, row))
+        except UntracedField:
+            row.missed = True
+        if row.missed:
+            return [formula(info, row) for row in full_rows()]
+    return values
+
+
+def clear_trace_cache():
+    """
+    Forgets every cached trace.
+    """
+    _TRACE_CACHE.clear()
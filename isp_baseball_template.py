@@ -7,24 +7,38 @@ about the expected behavior of the program.
 """
 
 import csv
+import os
+from contextlib import nullcontext
+
+import project
+from project import open_csv_source
+
+# memprofile.ENVIRONMENT_VARIABLE; memprofile (and with it tracemalloc) is
+# only imported once profiling is on.
+MEMPROFILE_VARIABLE = "BASEBALL_MEMPROFILE"
 
 ##
 ## Provided code from Week 3 Project
 ##
 
-def read_csv_as_list_dict(filename, separator, quote):
+def read_csv_as_list_dict(filename, separator, quote, records=False):
     """
     Inputs:
-      filename  - name of CSV file
+      filename  - name of CSV file, '.csv.gz' file, or
+                  'archive.zip::member.csv' archive member
       separator - character that separates fields
       quote     - character used to optionally quote fields
     Output:
       Returns a list of dictionaries where each item in the list
       corresponds to a row in the CSV file.  The dictionaries in the
       list map the field names to the field values for that row.
+      With records set to True, the rows are compact read-only records
+      sharing one header instead of dictionaries.
     """
+    if records:
+        return project.read_csv_as_list_dict(filename, separator, quote, records=True)
     table = []
-    with open(filename, newline='') as csvfile:
+    with open_csv_source(filename) as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
         for row in csvreader:
             table.append(row)
@@ -34,7 +48,8 @@ def read_csv_as_list_dict(filename, separator, quote):
 def read_csv_as_nested_dict(filename, keyfield, separator, quote):
     """
     Inputs:
-      filename  - name of CSV file
+      filename  - name of CSV file, '.csv.gz' file, or
+                  'archive.zip::member.csv' archive member
       keyfield  - field to use as key for rows
       separator - character that separates fields
       quote     - character used to optionally quote fields
@@ -45,7 +60,7 @@ def read_csv_as_nested_dict(filename, keyfield, separator, quote):
       field values for that row.
     """
     table = {}
-    with open(filename, newline='') as csvfile:
+    with open_csv_source(filename) as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
         for row in csvreader:
             rowid = row[keyfield]
@@ -106,6 +121,35 @@ def slugging_percentage(info, batting_stats):
     else:
         return 0
 
+def onbase_plus_slugging(info, batting_stats):
+    """
+    Inputs:
+      batting_stats - dictionary of batting statistics (values are strings)
+    Output:
+      Returns the on-base plus slugging percentage as a float
+    """
+    return onbase_percentage(info, batting_stats) + slugging_percentage(info, batting_stats)
+
+# Built-in formulas by their usual abbreviation
+FORMULAS = {"AVG": batting_average,
+            "OBP": onbase_percentage,
+            "SLG": slugging_percentage,
+            "OPS": onbase_plus_slugging}
+
+
+def builtin_stat_name(formula):
+    """
+    Inputs:
+      formula - a formula function
+    Output:
+      Returns the abbreviation of formula if it is one of the built-in
+      FORMULAS (the function itself, not an equivalent one), or None.
+    """
+    for name, builtin in FORMULAS.items():
+        if builtin is formula:
+            return name
+    return None
+
 
 ##
 ## Part 1: Functions to compute top batting statistics by year
@@ -121,7 +165,8 @@ def filter_by_year(statistics, year, yearid):
       Returns a list of batting statistics dictionaries that
       are from the input year.
     """
-    return []
+    year = str(year)
+    return [row for row in statistics if row[yearid] == year]
 
 
 def top_player_ids(info, statistics, formula, numplayers):
@@ -138,7 +183,10 @@ def top_player_ids(info, statistics, formula, numplayers):
       computed by formula, of the top numplayers players sorted in
       decreasing order of the computed statistic.
     """
-    return []
+    playerid = info["playerid"]
+    scores = [(row[playerid], formula(info, row)) for row in statistics]
+    scores.sort(key=lambda item: item[1], reverse=True)
+    return scores[:numplayers]
 
 
 def lookup_player_names(info, top_ids_and_stats):
@@ -153,10 +201,48 @@ def lookup_player_names(info, top_ids_and_stats):
       the input and "FirstName LastName" is the name of the player
       corresponding to the player ID in the input.
     """
-    return []
+    master = read_csv_as_nested_dict(info["masterfile"], info["playerid"],
+                                     info["separator"], info["quote"])
+    names = []
+    for playerid, stat in top_ids_and_stats:
+        player = master[playerid]
+        names.append("{:.3f} --- {} {}".format(stat, player[info["firstname"]],
+                                                player[info["lastname"]]))
+    return names
 
 
-def compute_top_stats_year(info, formula, numplayers, year):
+def profiling(profile, label):
+    """
+    Inputs:
+      profile - memory profiling switch or MemoryProfile, as taken by
+                the compute_top_stats functions
+      label   - name of the profiled computation
+    Output:
+      Returns memprofile.profiling(profile, label), or a context that
+      yields None without importing memprofile if profiling is off.
+    """
+    if profile is False or (profile is None
+                            and os.environ.get(MEMPROFILE_VARIABLE, "") in ("", "0")):
+        return nullcontext()
+    import memprofile  # pylint: disable=import-outside-toplevel
+    return memprofile.profiling(profile, label)
+
+
+def stage(active, name):
+    """
+    Inputs:
+      active - the MemoryProfile yielded by profiling, or None
+      name   - name of the stage
+    Output:
+      Returns a context profiling the body as a stage of active, or one
+      that does nothing if active is None.
+    """
+    if active is None:
+        return nullcontext()
+    return active.stage(name)
+
+
+def compute_top_stats_year(info, formula, numplayers, year, profile=None):
     """
     Inputs:
       info        - Baseball data information dictionary
@@ -165,11 +251,23 @@ def compute_top_stats_year(info, formula, numplayers, year):
                     computes a compound statistic
       numplayers  - Number of top players to return
       year        - Year to filter by
+      profile     - optional memory profiling switch or MemoryProfile
+                    (see memprofile.py); by default the
+                    BASEBALL_MEMPROFILE environment variable decides
     Outputs:
       Returns a list of strings for the top numplayers in the given year
       according to the given formula.
     """
-    return []
+    with profiling(profile, "compute_top_stats_year") as active:
+        with stage(active, "read_csv_as_list_dict"):
+            statistics = read_csv_as_list_dict(info["battingfile"], info["separator"],
+                                               info["quote"])
+        with stage(active, "filter_by_year"):
+            year_stats = filter_by_year(statistics, year, info["yearid"])
+        with stage(active, "top_player_ids"):
+            top_ids_and_stats = top_player_ids(info, year_stats, formula, numplayers)
+        with stage(active, "lookup_player_names"):
+            return lookup_player_names(info, top_ids_and_stats)
 
 
 ##
@@ -187,10 +285,21 @@ def aggregate_by_player_id(statistics, playerid, fields):
       are dictionaries of aggregated stats.  Only the fields from the fields
       input will be aggregated in the aggregated stats dictionaries.
     """
-    return {}
-
-
-def compute_top_stats_career(info, formula, numplayers):
+    aggregated = {}
+    for row in statistics:
+        player = row[playerid]
+        totals = aggregated.get(player)
+        if totals is None:
+            totals = {playerid: player}
+            for field in fields:
+                totals[field] = 0
+            aggregated[player] = totals
+        for field in fields:
+            totals[field] += int(row[field])
+    return aggregated
+
+
+def compute_top_stats_career(info, formula, numplayers, profile=None):
     """
     Inputs:
       info        - Baseball data information dictionary
@@ -198,8 +307,25 @@ def compute_top_stats_career(info, formula, numplayers):
                     batting statistics dictionary as input and
                     computes a compound statistic
       numplayers  - Number of top players to return
+      profile     - optional memory profiling switch or MemoryProfile
+                    (see memprofile.py); by default the
+                    BASEBALL_MEMPROFILE environment variable decides
+    Outputs:
+      Returns a list of strings for the top numplayers in their careers
+      according to the given formula.
     """
-    return []
+    with profiling(profile, "compute_top_stats_career") as active:
+        with stage(active, "read_csv_as_list_dict"):
+            statistics = read_csv_as_list_dict(info["battingfile"], info["separator"],
+                                               info["quote"])
+        with stage(active, "aggregate_by_player_id"):
+            career_stats = aggregate_by_player_id(statistics, info["playerid"],
+                                                  info["battingfields"])
+        with stage(active, "top_player_ids"):
+            top_ids_and_stats = top_player_ids(info, list(career_stats.values()),
+                                               formula, numplayers)
+        with stage(active, "lookup_player_names"):
+            return lookup_player_names(info, top_ids_and_stats)
 
 
 ##
@@ -0,0 +1,224 @@
+"""
+Hash joins across the Lahman tables (Batting, Master, Pitching, Fielding,
+Teams).
+
+A HashIndex is built once on the smaller side of a join, keyed by one or
+more configurable fields such as info["playerid"] or ["teamID", "yearID"],
+and can then be probed any number of times with rows from the larger side:
+an iterable of row dictionaries, streamed straight from a reader, or the
+integer-coded columns of a BattingDataset.  table_index keeps built indexes
+so that repeated queries against the same table reuse them.
+
+Example, top OPS in 2010 among players born after 1980:
+
+    master = table_index(info["masterfile"], info["playerid"])
+    rows = select_rows(data, master, lambda player: int(player["birthYear"] or 0) > 1980,
+                       data.year_index()["2010"])
+    data.lookup_player_names(data.top_player_ids(onbase_plus_slugging, 10, rows))
+"""
+
+from project import make_row_key, read_csv_as_list_dict, source_stamp
+
+# Built indexes, keyed by (source, key fields, separator, quote)
+_INDEX_CACHE = {}
+
+# Number of vocabularies an index keeps code maps for
+MAX_CODE_MAPS = 8
+
+
+class HashIndex:
+    """
+    Rows of one table grouped by a (possibly composite) key.
+    """
+
+    def __init__(self, rows, key):
+        """
+        Builds the index.
+
+        Args:
+            rows (iterable): Row dictionaries of the build side.
+            key (str or list): The key field, or a list of fields forming a
+                               composite key.
+        """
+        self.key = key
+        self.table = {}
+        for row in rows:
+            self.table.setdefault(make_row_key(row, key), []).append(row)
+        self._code_maps = {}
+
+    @classmethod
+    def from_csv(cls, filename, key, separator=',', quote='"'):
+        """
+        Builds an index over a CSV file, holding its rows as compact records.
+        """
+        return cls(read_csv_as_list_dict(filename, separator, quote, records=True), key)
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, key_value):
+        """
+        Returns the list of rows with the given key value (a tuple for a
+        composite key), or an empty list.
+        """
+        return self.table.get(key_value, [])
+
+    def probe(self, rows, key=None, how="inner"):
+        """
+        Joins rows from the probe side against the index.
+
+        Args:
+            rows (iterable): Row dictionaries; consumed one at a time.
+            key (str or list): The key field(s) in the probe rows.  Defaults
+                               to the index's own key.
+            how (str): "inner" yields only matching pairs; "left" also
+                       yields (row, None) for probe rows without a match.
+
+        Yields:
+            tuple: (probe row, build row) pairs.
+        """
+        if how not in ("inner", "left"):
+            raise ValueError("how must be 'inner' or 'left', not {!r}".format(how))
+        if key is None:
+            key = self.key
+        table = self.table
+        for row in rows:
+            matches = table.get(make_row_key(row, key))
+            if matches:
+                for match in matches:
+                    yield row, match
+            elif how == "left":
+                yield row, None
+
+    def code_map(self, vocabulary):
+        """
+        Maps the codes of a dictionary-encoded column to matching rows.
+
+        Each distinct key is hashed once here; probing by code afterwards
+        is a list lookup.  Maps for the last MAX_CODE_MAPS vocabularies are
+        kept.
+
+        Args:
+            vocabulary (list): The column's vocabulary, as in
+                               BattingDataset.vocabularies.
+
+        Returns:
+            list: For each code, the list of matching build rows (possibly
+                  empty).
+        """
+        # Maps are cached by id, but an id can be reused once a vocabulary
+        # is freed, so the entry also holds the vocabulary and is only
+        # used if it is the same object.
+        cached = self._code_maps.get(id(vocabulary))
+        if (cached is not None and cached[0] is vocabulary
+                and len(cached[1]) == len(vocabulary)):
+            return cached[1]
+        code_map = [self.table.get(value, []) for value in vocabulary]
+        self._code_maps.pop(id(vocabulary), None)
+        if len(self._code_maps) >= MAX_CODE_MAPS:
+            # Forget the oldest map.
+            del self._code_maps[next(iter(self._code_maps))]
+        self._code_maps[id(vocabulary)] = (vocabulary, code_map)
+        return code_map
+
+    def probe_codes(self, data, field, rows=None):
+        """
+        Joins rows of a BattingDataset against the index on an encoded
+        single-field key.
+
+        Args:
+            data (BattingDataset): The probe side.
+            field (str): The encoded key field in data.
+            rows (list): Optional row indices.  Defaults to all.
+
+        Yields:
+            tuple: (row index, build row) pairs for matching rows.
+        """
+        code_map = self.code_map(data.vocabularies[field])
+        column = data.columns[field]
+        if rows is None:
+            rows = range(data.num_rows)
+        for index in rows:
+            for match in code_map[column[index]]:
+                yield index, match
+
+
+def table_index(filename, key, separator=',', quote='"'):
+    """
+    Returns a HashIndex over a CSV table, reusing a previously built index
+    of the same table and key unless the file has changed since.
+    """
+    key_fields = key if isinstance(key, str) else tuple(key)
+    cache_key = (filename, key_fields, separator, quote)
+    stamp = source_stamp(filename)
+    cached = _INDEX_CACHE.get(cache_key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    index = HashIndex.from_csv(filename, key, separator, quote)
+    _INDEX_CACHE[cache_key] = (stamp, index)
+    return index
+
+
+def select_rows(data, index, predicate, rows=None, field=None):
+    """
+    Selects the dataset rows whose joined row satisfies a predicate, e.g.
+    batting rows of players born after 1980.
+
+    The predicate is evaluated once per distinct key, not once per row.
+
+    Args:
+        data (BattingDataset): The probe side.
+        index (HashIndex): The build side, keyed by a single field.
+        predicate (function): Takes a build row and returns True to keep
+                              the matching dataset rows.
+        rows (list): Optional row indices to select from.  Defaults to all.
+        field (str): The encoded key field in data.  Defaults to the
+                     player ID field.
+
+    Returns:
+        list: Indices of the selected rows, in order.
+    """
+    if field is None:
+        field = data.playerid
+    keep = [any(predicate(match) for match in matches)
+            for matches in index.code_map(data.vocabularies[field])]
+    column = data.columns[field]
+    if rows is None:
+        rows = range(data.num_rows)
+    return [row for row in rows if keep[column[row]]]
+
+
+def top_groups(data, group_field, formula, numgroups, rows=None, index=None,
+               name_field=None):
+    """
+    Ranks groups of rows, such as teams, by a formula applied to their
+    summed batting fields (e.g. per-team SLG).
+
+    Args:
+        data (BattingDataset): The batting data.
+        group_field (str): The encoded field to group by, e.g. "teamID".
+        formula (function): Takes an info dictionary and a dictionary of
+                            totals and computes a compound statistic.
+        numgroups (int): Number of top groups to return.
+        rows (list): Optional row indices, e.g. one year's rows.
+        index (HashIndex): Optional index keyed by group_field (e.g. over
+                           the Teams table) used to look up display names.
+        name_field (str): The field of index rows holding the name.
+
+    Returns:
+        list: Strings of the form "x.xxx --- name", where name is the
+              joined name if available and the group value otherwise.
+    """
+    info = data.info
+    totals = data.aggregate_by(group_field, info["battingfields"], rows)
+    scores = [(code, formula(info, stats)) for code, stats in totals.items()]
+    scores.sort(key=lambda item: item[1], reverse=True)
+
+    names = index.code_map(data.vocabularies[group_field]) if index is not None else None
+    result = []
+    for code, stat in scores[:numgroups]:
+        name = data.decode(group_field, code)
+        if names is not None and names[code] and name_field is not None:
+            name = names[code][-1][name_field]
+        result.append("{:.3f} --- {}".format(stat, name))
+    return result
@@ -0,0 +1,375 @@
+"""
+Precomputed leaderboards for every season and built-in statistic.
+
+build_leaderboards ranks every row of every year, and every career, by each
+formula in isp_baseball_template.FORMULAS and writes the top entries of
+each board to one indexed file.  A query then reads the small index once,
+seeks to the board and slices it, instead of loading and ranking the
+batting file.  compute_top_stats falls back to live computation for custom
+formulas, for more players than were stored, and when the batting or
+master file has changed since the boards were built (the index records
+the size and modification time of both).
+
+RankIndex answers the reverse question, "where does player X rank in
+year Y", in logarithmic time from a sorted score index per (year, stat).
+
+File layout (all text is UTF-8):
+    MAGIC                      - identifies the format
+    8-byte big-endian offset   - position of the index
+    boards                     - one "stat<TAB>playerID<TAB>name" line per
+                                 entry, best first, boards back to back
+    index                      - JSON: {"depth": K, "sources":
+                                 {"battingfile": [size, mtime_ns],
+                                  "masterfile": [size, mtime_ns]},
+                                 "boards":
+                                 {"AVG/2010": [offset, length, count], ...}}
+
+Usage:
+    python leaderboards.py INFO_FILE OUTPUT_FILE [--depth K]
+"""
+
+import json
+import struct
+from bisect import bisect_left, bisect_right
+
+from dataset import BattingDataset
+from isp_baseball_template import FORMULAS, builtin_stat_name
+from project import source_stamp
+
+MAGIC = b"LEADERBOARDS 1\n"
+
+# Number of entries stored per board by default
+DEFAULT_DEPTH = 100
+
+CAREER = "career"
+
+
+def board_key(stat, year=None):
+    """
+    Returns the index key of a board: "STAT/YEAR" or "STAT/career".
+    """
+    return "{}/{}".format(stat, CAREER if year is None else year)
+
+
+def _source_stamps(info):
+    """
+    Returns the stamps of the files the boards are computed from, as
+    stored in the index.
+    """
+    return {key: list(source_stamp(info[key])) for key in ("battingfile", "masterfile")}
+
+
+def _board_lines(data, scores, depth):
+    """
+    Sorts (player code, statistic) pairs and formats the best depth of them
+    as board lines.
+    """
+    scores.sort(key=lambda item: item[1], reverse=True)
+    lines = []
+    for code, stat in scores[:depth]:
+        lines.append("{!r}\t{}\t{}\n".format(stat, data.decode(data.playerid, code),
+                                              data.player_name(code)))
+    return lines
+
+
+def build_leaderboards(info, filename, depth=DEFAULT_DEPTH, data=None):
+    """
+    Computes the top entries of every built-in formula for every year and
+    for careers, and writes them to an indexed leaderboard file.
+
+    Args:
+        info (dict): Baseball data information dictionary.
+        filename (str): The leaderboard file to write.
+        depth (int): Number of entries stored per board.
+        data (BattingDataset): Optional already-loaded dataset.
+
+    Returns:
+        int: The number of boards written.
+    """
+    if data is None:
+        data = BattingDataset.load(info)
+    players = data.columns[data.playerid]
+
+    boards = {}
+    for year, rows in data.year_index().items():
+        # Build each row dictionary once and evaluate every formula on it.
+        year_rows = [(players[index], data.row(index)) for index in rows]
+        for stat, formula in FORMULAS.items():
+            scores = [(code, formula(info, row)) for code, row in year_rows]
+            boards[board_key(stat, year)] = _board_lines(data, scores, depth)
+
+    career_stats = data.aggregate_by_player_id(info["battingfields"])
+    for stat, formula in FORMULAS.items():
+        scores = [(code, formula(info, stats)) for code, stats in career_stats.items()]
+        boards[board_key(stat)] = _board_lines(data, scores, depth)
+
+    # Stamped before writing, so a file changed meanwhile makes them stale.
+    sources = _source_stamps(info)
+    index = {}
+    with open(filename, "wb") as board_file:
+        board_file.write(MAGIC)
+        board_file.write(struct.pack(">Q", 0))
+        for key, lines in boards.items():
+            block = "".join(lines).encode("utf-8")
+            index[key] = [board_file.tell(), len(block), len(lines)]
+            board_file.write(block)
+        index_offset = board_file.tell()
+        board_file.write(json.dumps({"depth": depth, "sources": sources,
+                                     "boards": index}).encode("utf-8"))
+        board_file.seek(len(MAGIC))
+        board_file.write(struct.pack(">Q", index_offset))
+    return len(boards)
+
+
+class Leaderboards:
+    """
+    Read access to a leaderboard file written by build_leaderboards.
+    """
+
+    def __init__(self, filename):
+        """
+        Reads the index of a leaderboard file.
+
+        Args:
+            filename (str): The leaderboard file.
+
+        Raises:
+            ValueError: If the file is not a leaderboard file.
+        """
+        self.filename = filename
+        with open(filename, "rb") as board_file:
+            if board_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a leaderboard file".format(filename))
+            (index_offset,) = struct.unpack(">Q", board_file.read(8))
+            board_file.seek(index_offset)
+            index = json.loads(board_file.read().decode("utf-8"))
+        self.depth = index["depth"]
+        self.sources = index.get("sources")
+        self.boards = index["boards"]
+
+    def is_current(self, info):
+        """
+        Returns True if the boards were built from the current versions of
+        the batting and master files named by info.  Files written before
+        the stamps were recorded are never current.
+        """
+        try:
+            return self.sources == _source_stamps(info)
+        except OSError:
+            return False
+
+    def can_answer(self, stat, numplayers, year=None):
+        """
+        Returns True if the stored board holds the top numplayers entries.
+        """
+        entry = self.boards.get(board_key(stat, year))
+        if entry is None:
+            # Only boards of years without any batting rows are missing.
+            return stat in FORMULAS
+        return numplayers <= self.depth or entry[2] < self.depth
+
+    def top_entries(self, stat, numplayers, year=None):
+        """
+        Reads the top entries of one board.
+
+        Args:
+            stat (str): The formula name, such as "OPS".
+            numplayers (int): Number of entries to return.
+            year (int): The year, or None for careers.
+
+        Returns:
+            list: (statistic, playerID, name) tuples, best first.
+        """
+        entry = self.boards.get(board_key(stat, year))
+        if entry is None or numplayers <= 0:
+            return []
+        offset, length, _ = entry
+        with open(self.filename, "rb") as board_file:
+            board_file.seek(offset)
+            lines = board_file.read(length).decode("utf-8").splitlines()
+        entries = []
+        for line in lines[:numplayers]:
+            stat_value, playerid, name = line.split("\t", 2)
+            entries.append((float(stat_value), playerid, name))
+        return entries
+
+    def top_stats(self, stat, numplayers, year=None):
+        """
+        Returns "x.xxx --- FirstName LastName" strings for the top
+        numplayers of one board, like compute_top_stats_year/career.
+        """
+        return ["{:.3f} --- {}".format(stat_value, name)
+                for stat_value, _, name in self.top_entries(stat, numplayers, year)]
+
+
+class RankIndex:
+    """
+    Sorted score indexes for rank, percentile and page queries.
+
+    One index is built lazily per (stat, year) from the dataset's year
+    index and the formula's results, and kept for later queries.  Rows are
+    ranked like compute_top_stats_year (each stint separately) unless
+    seasons is True, in which case season totals are ranked.  A player's
+    rank is that of their best entry, counting only strictly better scores,
+    so tied players share a rank.
+    """
+
+    def __init__(self, data, formulas=None, seasons=False):
+        """
+        Args:
+            data (BattingDataset): The loaded dataset.
+            formulas (dict): Maps stat names to formulas.  Defaults to
+                             isp_baseball_template.FORMULAS.
+            seasons (bool): If True, rank season totals instead of stints.
+        """
+        self.data = data
+        self.formulas = FORMULAS if formulas is None else formulas
+        self.seasons = seasons
+        self._indexes = {}
+        self._player_years = None
+
+    def _index(self, stat, year):
+        """
+        Returns the (entries, negated scores, best positions) index of one
+        board, building it on first use.
+        """
+        key = (stat, year)
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+
+        data = self.data
+        formula = self.formulas[stat]
+        if year is None:
+            entries = data.rank_totals(formula, None, data.aggregate_by_player_id)
+        elif self.seasons:
+            year_totals = data.season_totals().get(str(year), {})
+            entries = data.rank_totals(formula, None, lambda fields: year_totals)
+        else:
+            rows = data.year_index().get(str(year), [])
+            entries = data.top_player_ids(formula, None, rows)
+
+        # Scores are negated so that the descending order is ascending for
+        # bisect.
+        negated = [-stat_value for _, stat_value in entries]
+        best = {}
+        for position, (code, _) in enumerate(entries):
+            best.setdefault(code, position)
+        index = self._indexes[key] = (entries, negated, best)
+        return index
+
+    def rank(self, playerid, stat, year=None):
+        """
+        Finds a player's rank and percentile on one board.
+
+        Args:
+            playerid (str): The player ID.
+            stat (str): The stat name, such as "OPS".
+            year (int): The year, or None for careers.
+
+        Returns:
+            tuple: (rank, percentile, statistic), where rank starts at 1 and
+                   percentile is the percentage of entries with a strictly
+                   lower score; None if the player has no entry.
+        """
+        entries, negated, best = self._index(stat, year)
+        code = self.data.encode(self.data.playerid, playerid)
+        position = best.get(code)
+        if position is None:
+            return None
+        stat_value = entries[position][1]
+        better = bisect_left(negated, -stat_value)
+        not_lower = bisect_right(negated, -stat_value)
+        percentile = 100.0 * (len(entries) - not_lower) / len(entries)
+        return better + 1, percentile, stat_value
+
+    def page(self, stat, first, last, year=None):
+        """
+        Returns the entries ranked first to last (1-based, inclusive) by
+        position, e.g. page("AVG", 51, 100, 2010).
+
+        Returns:
+            list: Strings of the form "x.xxx --- FirstName LastName".
+        """
+        entries, _, _ = self._index(stat, year)
+        return self.data.lookup_player_names(entries[max(first, 1) - 1:last])
+
+    def player_ranks(self, playerid, stats=None):
+        """
+        Ranks a player on several stats in every season they played.
+
+        Args:
+            playerid (str): The player ID.
+            stats (list): Stat names.  Defaults to every formula.
+
+        Returns:
+            dict: Maps each year the player played (as an int) to a
+                  dictionary mapping stat names to the result of rank.
+        """
+        if stats is None:
+            stats = list(self.formulas)
+        if self._player_years is None:
+            data = self.data
+            years = data.vocabularies[data.info["yearid"]]
+            player_years = {}
+            for code, year_code in zip(data.columns[data.playerid],
+                                       data.columns[data.info["yearid"]]):
+                player_years.setdefault(code, set()).add(int(years[year_code]))
+            self._player_years = player_years
+
+        code = self.data.encode(self.data.playerid, playerid)
+        return {year: {stat: self.rank(playerid, stat, year) for stat in stats}
+                for year in sorted(self._player_years.get(code, ()))}
+
+
+def compute_top_stats(info, formula, numplayers, year=None, boards=None, data=None):
+    """
+    Answers a top-N query from precomputed leaderboards when possible.
+
+    Args:
+        info (dict): Baseball data information dictionary.
+        formula (function): The formula to rank by.
+        numplayers (int): Number of top players to return.
+        year (int): The year, or None for careers.
+        boards (Leaderboards): Optional precomputed leaderboards, ignored
+                               if they are stale.
+        data (BattingDataset): Optional loaded dataset for live queries.
+
+    Returns:
+        list: Strings for the top numplayers according to formula, the same
+              as compute_top_stats_year/compute_top_stats_career.
+    """
+    stat = builtin_stat_name(formula)
+    if (boards is not None and stat is not None and boards.can_answer(stat, numplayers, year)
+            and boards.is_current(info)):
+        return boards.top_stats(stat, numplayers, year)
+
+    if data is None:
+        data = BattingDataset.load(info)
+    if year is None:
+        return data.compute_top_stats_career(formula, numplayers)
+    return data.compute_top_stats_year(formula, numplayers, year)
+
+
+def main(argv=None):
+    """
+    Builds a leaderboard file from the command line.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute leaderboards.")
+    parser.add_argument("info_file", help="JSON file with the baseball data information")
+    parser.add_argument("output_file", help="leaderboard file to write")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH,
+                        help="entries stored per board (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    with open(args.info_file, "r", encoding="utf-8") as info_file:
+        info = json.load(info_file)
+    count = build_leaderboards(info, args.output_file, args.depth)
+    print("Wrote {} leaderboards to {}".format(count, args.output_file))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
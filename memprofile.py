@@ -0,0 +1,290 @@
+"""
+Peak-memory profiling with tracemalloc.
+
+A MemoryProfile traces allocations while a computation runs and records,
+for each named stage (such as reading the batting file, aggregating and
+ranking), how much memory the stage left allocated, the peak it reached
+and the source lines that allocated the most.  report returns all of this
+as a dictionary that can be dumped as JSON.
+
+Functions that support profiling take a profile argument:
+    - a MemoryProfile to fill in,
+    - True to profile the call and emit the report (see emit_report),
+    - False to never profile,
+    - None (the default) to profile only if the environment variable
+      named by ENVIRONMENT_VARIABLE is set.
+
+Setting the variable to "1" writes each report as one JSON line to
+standard error; any other value (except "0") names a file the JSON lines
+are appended to.  When profiling is off the stages cost nothing.
+
+Example:
+    profile = MemoryProfile("career")
+    compute_top_stats_career(info, formula, 10, profile=profile)
+    print(profile.report()["peak_bytes"])
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+ENVIRONMENT_VARIABLE = "BASEBALL_MEMPROFILE"
+
+# Number of allocation sites listed per report and per stage
+TOP_SITES = 10
+
+# Traces of the profiler itself are left out of the allocation sites.
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"))
+
+# Open peak windows of profiles and stages, outermost first
+_WINDOWS = []
+
+# The MemoryProfile that started tracemalloc, if any.  The traced peak is
+# only reset while it traces, so other tracers never see it reset.
+_tracing_owner = None
+
+
+def _sites(statistics, top):
+    """
+    Converts tracemalloc statistics into site dictionaries.
+    """
+    sites = []
+    for statistic in statistics[:top]:
+        frame = statistic.traceback[0]
+        sites.append({"site": "{}:{}".format(frame.filename, frame.lineno),
+                      "size_bytes": getattr(statistic, "size_diff", statistic.size),
+                      "count": getattr(statistic, "count_diff", statistic.count)})
+    return sites
+
+
+class _PeakWindow:
+    """
+    Measures the highest traced memory while it is open.
+
+    tracemalloc keeps a single peak.  A window resets it (where possible)
+    to measure its own peak, after folding the peak so far into every
+    enclosing window, so nested windows never hide an outer peak.  Without
+    a reset, the peak is only known if it rose above the peak at opening.
+    """
+
+    def __init__(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        for window in _WINDOWS:
+            window.peak = max(window.peak, peak)
+        self.start_peak = peak
+        self.reset = _tracing_owner is not None and _reset_peak()
+        self.peak = 0 if self.reset else peak
+        _WINDOWS.append(self)
+
+    def value(self):
+        """
+        Returns the peak so far, or None if it is unknown.
+        """
+        if tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        if self.reset or self.peak > self.start_peak:
+            return self.peak
+        return None
+
+    def close(self):
+        """
+        Closes the window and returns its peak, or None if it is unknown.
+        """
+        _WINDOWS.remove(self)
+        return self.value()
+
+
+def _reset_peak():
+    """
+    Resets the traced peak where supported (Python 3.9 and later).
+    Returns True if it was reset.
+    """
+    reset_peak = getattr(tracemalloc, "reset_peak", None)
+    if reset_peak is None:
+        return False
+    reset_peak()
+    return True
+
+
+class MemoryProfile:
+    """
+    Allocation statistics of one profiled computation.
+    """
+
+    def __init__(self, label="", top_sites=TOP_SITES):
+        """
+        Args:
+            label (str): Name of the computation, included in the report.
+            top_sites (int): Number of allocation sites to report.
+        """
+        self.label = label
+        self.top_sites = top_sites
+        self.stages = []
+        self._started_tracing = False
+        self._start = None
+        self._snapshot = None
+        self._first_snapshot = None
+        self._peak_snapshot = None
+        self._peak_current = -1
+        self._window = None
+        self._peak = None
+        self._end = None
+
+    def start(self):
+        """
+        Starts tracing (unless tracemalloc is already tracing).
+        """
+        global _tracing_owner  # pylint: disable=global-statement
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+            _tracing_owner = self
+        self._window = _PeakWindow()
+        self._start = tracemalloc.get_traced_memory()[0]
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        self._first_snapshot = self._snapshot
+
+    def stop(self):
+        """
+        Records the final totals and stops tracing if start began it.
+        """
+        global _tracing_owner  # pylint: disable=global-statement
+        self._peak = self._window.close()
+        self._end = tracemalloc.get_traced_memory()[0]
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+            _tracing_owner = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profiles the body of a with statement as a named stage.
+        """
+        before = tracemalloc.get_traced_memory()[0]
+        window = _PeakWindow()
+        try:
+            yield
+        finally:
+            peak = window.close()
+            after = tracemalloc.get_traced_memory()[0]
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            statistics = snapshot.compare_to(self._snapshot, "lineno")
+            statistics.sort(key=lambda statistic: statistic.size_diff, reverse=True)
+            self.stages.append({"name": name,
+                                "delta_bytes": after - before,
+                                "peak_bytes": None if peak is None else peak - before,
+                                "top_sites": _sites(statistics, self.top_sites)})
+            self._snapshot = snapshot
+            if after > self._peak_current:
+                self._peak_current = after
+                self._peak_snapshot = snapshot
+
+    def report(self):
+        """
+        Returns the profile as a dictionary:
+
+            {"label": ..., "peak_bytes": highest traced memory above the
+             start, "retained_bytes": memory still allocated when
+             profiling stopped,
+             "stages": [{"name", "delta_bytes", "peak_bytes",
+                         "top_sites"}, ...],
+             "top_sites": [{"site": "file:line", "size_bytes", "count"},
+                           ...]}
+
+        A stage's delta_bytes is what it left allocated, its peak_bytes the
+        most it had allocated at once, and its top_sites the lines that
+        allocated what it left.  The overall top_sites are the largest live
+        allocations at the stage end with the most memory in use.
+
+        Peaks are None when they cannot be measured: before Python 3.9, or
+        when another tracer started tracemalloc (whose peak is then never
+        reset) and the peak stayed below the one at the start.
+        """
+        end, peak = self._end, self._peak
+        if end is None:
+            end = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            peak = self._window.value() if self._window is not None else None
+        top_sites = []
+        if self._peak_snapshot is not None:
+            statistics = self._peak_snapshot.compare_to(self._first_snapshot, "lineno")
+            statistics.sort(key=lambda statistic: statistic.size_diff, reverse=True)
+            top_sites = _sites(statistics, self.top_sites)
+        return {"label": self.label,
+                "peak_bytes": None if peak is None else max(peak - (self._start or 0), 0),
+                "retained_bytes": end - (self._start or 0),
+                "stages": list(self.stages),
+                "top_sites": top_sites}
+
+
+def emit_report(profile, destination=None):
+    """
+    Writes a profile's report as one JSON line to standard error, or
+    appends it to the file named by destination.
+    """
+    line = json.dumps(profile.report(), sort_keys=True)
+    if destination is None or destination == "1":
+        sys.stderr.write(line + "\n")
+    else:
+        with open(destination, "a", encoding="utf-8") as report_file:
+            report_file.write(line + "\n")
+
+
+@contextmanager
+def profiling(profile, label):
+    """
+    Profiles the body of a with statement according to a profile argument
+    (see the module documentation).
+
+    Yields:
+        MemoryProfile: The active profile, or None if profiling is off.
+    """
+    destination = None
+    if profile is None:
+        destination = os.environ.get(ENVIRONMENT_VARIABLE, "")
+        profile = destination not in ("", "0")
+    if profile is False:
+        yield None
+        return
+    emit = profile is True
+    if emit:
+        profile = MemoryProfile(label)
+    with profile:
+        yield profile
+    if emit:
+        emit_report(profile, destination or None)
+
+
+def stage(profile, name):
+    """
+    Returns a context manager profiling a stage of profile, or one that does
+    nothing if profile is None.
+    """
+    if profile is None:
+        return _NO_STAGE
+    return profile.stage(name)
+
+
+class _NoStage:
+    """A reusable context manager that does nothing."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
@@ -1,3 +1,5 @@
+import project
+
 # Make sure to have these helper functions defined.
 # The tests for `top_player_ids` use them.
 
@@ -86,55 +88,54 @@ def aggregate_by_player_id(statistics, playerid, fields):
                 
     return list(aggregated_stats.values())
 
+def _load_files(info):
+    """
+    Starts loading the batting and master files together.  The master
+    file is indexed by player ID on its loader thread, so the index is
+    ready by the time the batting rows have been ranked.
+    """
+    return project.start_csv_reads(
+        [info['battingfile'], (info['masterfile'], info['playerid'])],
+        info['separator'], info['quote'])
+
+def _format_top_stats(info, top_ids_stats, master_index):
+    """
+    Formats (player ID, stat) tuples as "x.xxx --- FirstName LastName".
+    """
+    result = []
+    for player_id, stat in top_ids_stats:
+        row = master_index.get(player_id)
+        name = row[info['firstname']] + " " + row[info['lastname']] if row else "Unknown Player"
+        result.append("{:.3f} --- {}".format(stat, name))
+    return result
+
 def compute_top_stats_year(info, formula, k, year):
     """
     Computes top stats for a single year.
     """
-    # batting_data = read_csv(info['battingfile']) # You need a CSV reader
-    # master_data = read_csv(info['masterfile']) # You need a CSV reader
-    
-    # For this example, let's assume batting_data and master_data are available.
-    # The following is a conceptual flow.
-    
+    batting_future, master_future = _load_files(info)
+
     # 1. Filter batting data by year
-    # year_stats = filter_by_year(batting_data, year, info['yearid'])
-    
+    year_stats = filter_by_year(batting_future.result(), year, info['yearid'])
+
     # 2. Get top player IDs for that year
-    # top_ids_stats = top_player_ids(info, year_stats, formula, k)
-    
-    # 3. Look up names
-    # name_mapping = {row[info['playerid']]: row[info['firstname']] + " " + row[info['lastname']] for row in master_data}
+    top_ids_stats = top_player_ids(info, year_stats, formula, k)
 
-    # 4. Format output
-    # result = []
-    # for player_id, stat in top_ids_stats:
-    #     name = name_mapping.get(player_id, "Unknown Player")
-    #     result.append("{:.3f} --- {}".format(stat, name))
-        
-    # return result
-    pass # You would implement the full logic here.
+    # 3. Look up names and format output
+    return _format_top_stats(info, top_ids_stats, master_future.result())
 
 def compute_top_stats_career(info, formula, k):
     """
     Computes top stats for a player's career.
     """
-    # batting_data = read_csv(info['battingfile']) # You need a CSV reader
-    # master_data = read_csv(info['masterfile']) # You need a CSV reader
+    batting_future, master_future = _load_files(info)
 
     # 1. Aggregate stats by player
-    # career_stats = aggregate_by_player_id(batting_data, info['playerid'], info['battingfields'])
+    career_stats = aggregate_by_player_id(batting_future.result(), info['playerid'],
+                                          info['battingfields'])
 
     # 2. Get top player IDs for careers
-    # top_ids_stats = top_player_ids(info, career_stats, formula, k)
+    top_ids_stats = top_player_ids(info, career_stats, formula, k)
 
-    # 3. Look up names
-    # name_mapping = {row[info['playerid']]: row[info['firstname']] + " " + row[info['lastname']] for row in master_data}
-
-    # 4. Format output
-    # result = []
-    # for player_id, stat in top_ids_stats:
-    #     name = name_mapping.get(player_id, "Unknown Player")
-    #     result.append("{:.3f} --- {}".format(stat, name))
-        
-    # return result
-    pass # You would implement the full logic here.
+    # 3. Look up names and format output
+    return _format_top_stats(info, top_ids_stats, master_future.result())
@@ -1,73 +1,591 @@
 """
 Project for Week 2 of "Python Data Analysis".
 This project includes functions to read from and write to CSV files.
+
+Every reader accepts three kinds of source:
+- a plain path such as 'batting1.csv',
+- a gzip-compressed file such as 'batting1.csv.gz',
+- a member of a zip archive such as 'isp_baseball_files.zip::batting1.csv'.
+Compressed sources are decompressed as a stream straight into the parser.
 """
 
 import csv
+import io
+import os
+from array import array
+from contextlib import contextmanager
+from itertools import chain, islice
+from operator import itemgetter
+
+# Separates an archive path from a member name in a CSV source
+ARCHIVE_SEPARATOR = '::'
+
+# Number of data rows read_csv_schema inspects by default
+SCHEMA_SAMPLE_SIZE = 1000
+
+# Column types inferred by read_csv_schema, from most to least specific
+COLUMN_TYPES = ('int', 'float', 'str')
+
+
+@contextmanager
+def open_csv_source(source):
+    """
+    Opens a CSV source for reading as text.
+
+    Args:
+        source (str): A file path, a '.gz' file path, or an
+                      'archive.zip::member.csv' reference.
+
+    Yields:
+        A text file object suitable for csv.reader.
+    """
+    # The compression modules are imported on demand to keep start-up fast
+    # for plain CSV files.
+    if ARCHIVE_SEPARATOR in source:
+        import zipfile
+        archive, member = source.split(ARCHIVE_SEPARATOR, 1)
+        with zipfile.ZipFile(archive) as zip_file:
+            with zip_file.open(member) as raw_file:
+                yield io.TextIOWrapper(raw_file, encoding='utf-8', newline='')
+    elif source.endswith('.gz'):
+        import gzip
+        with gzip.open(source, 'rt', newline='', encoding='utf-8') as csvfile:
+            yield csvfile
+    else:
+        with open(source, 'r', newline='', encoding='utf-8') as csvfile:
+            yield csvfile
+
+
+def source_stamp(source):
+    """
+    Returns the size and modification time of the file holding a CSV
+    source (the archive, for an 'archive.zip::member.csv' reference).
+
+    Args:
+        source (str): A CSV source, as for open_csv_source.
+
+    Returns:
+        tuple: (size in bytes, modification time in nanoseconds), which
+               changes whenever the file is rewritten.
+    """
+    status = os.stat(source.split(ARCHIVE_SEPARATOR, 1)[0])
+    return status.st_size, status.st_mtime_ns
+
+
+def list_archive_members(archive, suffix='.csv'):
+    """
+    Lists the CSV members of a zip archive as CSV sources.
+
+    Args:
+        archive (str): The path to the zip archive.
+        suffix (str): Only members whose names end with suffix are listed.
+
+    Returns:
+        list: Sources of the form 'archive::member', in archive order.
+    """
+    import zipfile
+    with zipfile.ZipFile(archive) as zip_file:
+        return [archive + ARCHIVE_SEPARATOR + name for name in zip_file.namelist()
+                if name.endswith(suffix)]
 
 def read_csv_fieldnames(filename, separator=',', quote='"'):
     """
     Reads the field names from a CSV file.
 
     Args:
-        filename (str): The name of the CSV file.
+        filename (str): The name of the CSV file or archive source.
         separator (str): The character used to separate fields.
         quote (str): The character used to quote fields.
 
     Returns:
         list: A list of strings containing the field names.
     """
-    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+    with open_csv_source(filename) as csvfile:
         reader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
         # The fieldnames are the first row in the CSV file
         fieldnames = next(reader)
     return fieldnames
 
 
-def read_csv_as_list_dict(filename, separator=',', quote='"'):
+def _value_type(value):
+    """
+    Returns the most specific of COLUMN_TYPES that can hold a non-blank
+    string value.
+    """
+    try:
+        int(value)
+        return 'int'
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return 'float'
+    except ValueError:
+        return 'str'
+
+
+def read_csv_schema(filename, separator=',', quote='"', sample_size=SCHEMA_SAMPLE_SIZE):
+    """
+    Reads the field names from a CSV file, like read_csv_fieldnames, and
+    infers the type of each column from the first rows.
+
+    Blank values are ignored, so a column is 'int' if every non-blank
+    sampled value is an integer, 'float' if every one is a number, and
+    'str' otherwise.  A column that is blank throughout the sample is
+    assumed to be 'int'; read_csv_as_typed_columns widens it if later
+    values need it.
+
+    Args:
+        filename (str): The name of the CSV file or archive source.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+        sample_size (int): Number of data rows to inspect.
+
+    Returns:
+        list: (field name, type) pairs, in column order, where type is one
+              of COLUMN_TYPES.
+    """
+    with open_csv_source(filename) as csvfile:
+        reader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(reader, [])
+        ranks = [0] * len(fieldnames)
+        for row in islice(reader, sample_size):
+            for position, value in enumerate(row[:len(fieldnames)]):
+                if value and ranks[position] < 2:
+                    rank = COLUMN_TYPES.index(_value_type(value))
+                    if rank > ranks[position]:
+                        ranks[position] = rank
+    return [(field, COLUMN_TYPES[rank]) for field, rank in zip(fieldnames, ranks)]
+
+
+def is_valid(validity, index):
+    """
+    Returns True if bit index of a validity bitmap is set, that is, if row
+    index of the column was not blank.
+    """
+    return bool(validity[index >> 3] & (1 << (index & 7)))
+
+
+def _validity_bitmap(num_rows, nulls):
+    """
+    Builds a validity bitmap with one bit per row, set for every row not
+    in the list of null row indices.
+    """
+    validity = bytearray(b'\xff') * ((num_rows + 7) // 8)
+    if num_rows & 7:
+        validity[-1] = (1 << (num_rows & 7)) - 1
+    for index in nulls:
+        validity[index >> 3] &= ~(1 << (index & 7)) & 0xff
+    return validity
+
+
+# Record types generated by make_record_type, keyed by field names
+_RECORD_TYPES = {}
+
+
+def make_record_type(fieldnames):
+    """
+    Returns a compact row type for the given header.
+
+    Instances are tuples of field values, so they carry no per-row
+    dictionary; the field name to position map lives on the class and is
+    shared by every row with the same header.  Rows still behave like
+    read-only dictionaries: row[field], row.get(field), field in row,
+    keys(), values(), items() and dict(row) all work, and row[index]
+    returns the value at a position.  As with dictionaries, iterating
+    over a row yields its field names, and keys() is a set-like view.
+    Rows can be pickled, e.g. to send them to other processes.
+
+    Args:
+        fieldnames (list): The field names, in column order.
+
+    Returns:
+        type: A tuple subclass holding one value per field.
+    """
+    fieldnames = tuple(fieldnames)
+    record_type = _RECORD_TYPES.get(fieldnames)
+    if record_type is not None:
+        return record_type
+
+    index = {field: position for position, field in enumerate(fieldnames)}
+    getvalue = tuple.__getitem__
+
+    class Record(tuple):
+        """A read-only CSV row sharing its header with the whole table."""
+        __slots__ = ()
+        _fields = fieldnames
+        _index = index
+
+        def __getitem__(self, key):
+            if key.__class__ is str:
+                return getvalue(self, index[key])
+            return getvalue(self, key)
+
+        def get(self, key, default=None):
+            position = index.get(key)
+            if position is None:
+                return default
+            return getvalue(self, position)
+
+        def __contains__(self, key):
+            return key in index
+
+        def __iter__(self):
+            return iter(fieldnames)
+
+        def keys(self):
+            return index.keys()
+
+        def values(self):
+            return tuple(tuple.__iter__(self))
+
+        def items(self):
+            return zip(fieldnames, tuple.__iter__(self))
+
+        def __repr__(self):
+            return repr(dict(self.items()))
+
+        def __reduce__(self):
+            # The class is created at run time, so pickle the header and
+            # rebuild the class (or reuse it) when unpickling.
+            return _rebuild_record, (fieldnames, tuple(tuple.__iter__(self)))
+
+    _RECORD_TYPES[fieldnames] = Record
+    return Record
+
+
+def _rebuild_record(fieldnames, values):
+    """
+    Recreates a pickled row of make_record_type.
+    """
+    return make_record_type(fieldnames)(values)
+
+
+def read_csv_as_list_dict(filename, separator=',', quote='"', records=False):
     """
     Reads a CSV file and returns its contents as a list of dictionaries.
 
     Args:
-        filename (str): The name of the CSV file.
+        filename (str): The name of the CSV file or archive source.
         separator (str): The character used to separate fields.
         quote (str): The character used to quote fields.
+        records (bool): If True, return compact rows built by
+                        make_record_type instead of dictionaries.  They
+                        support the same read access by field name at a
+                        fraction of the memory.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a row.
     """
-    table = []
-    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
+    with open_csv_source(filename) as csvfile:
+        if not records:
+            return list(csv.DictReader(csvfile, delimiter=separator, quotechar=quote))
+        reader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(reader, [])
+        record_type = make_record_type(fieldnames)
+        width = len(fieldnames)
+        table = []
         for row in reader:
-            table.append(dict(row))
+            if len(row) != width:
+                if not row:
+                    continue
+                # Match DictReader: pad short rows with None, drop extras.
+                row = (row + [None] * width)[:width]
+            table.append(record_type(row))
     return table
 
 
+def read_csv_as_columns(filename, separator=',', quote='"', fields=None, encode=()):
+    """
+    Reads a CSV file column by column.
+
+    Columns listed in encode are dictionary-encoded: each distinct string
+    is stored once in a vocabulary and the column holds compact integer
+    codes into it, numbered in order of first appearance.  Other columns
+    are lists of strings.
+
+    Args:
+        filename (str): The name of the CSV file or archive source.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+        fields (list): Optional list of columns to load; other columns are
+                       skipped.  Defaults to every column.
+        encode (list): Columns to dictionary-encode.  Names that are not
+                       loaded are ignored.
+
+    Returns:
+        tuple: (columns, vocabularies) where columns maps each loaded field
+               name to its column (an array of codes for encoded fields,
+               otherwise a list of strings), and vocabularies maps each
+               encoded field name to its list of distinct strings, so that
+               vocabularies[field][code] decodes a code.
+    """
+    with open_csv_source(filename) as csvfile:
+        reader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        header = next(reader, [])
+        wanted = header if fields is None else [field for field in header if field in fields]
+        width = len(header)
+
+        columns = {}
+        vocabularies = {}
+        plain = []
+        encoded = []
+        for field in wanted:
+            position = header.index(field)
+            if field in encode:
+                columns[field] = array('i')
+                vocabularies[field] = []
+                encoded.append((position, columns[field].append, {}, vocabularies[field]))
+            else:
+                columns[field] = []
+                plain.append((position, columns[field].append))
+
+        for row in reader:
+            if len(row) != width:
+                if not row:
+                    continue
+                row = (row + [None] * width)[:width]
+            for position, append in plain:
+                append(row[position])
+            for position, append, codes, vocabulary in encoded:
+                value = row[position]
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(vocabulary)
+                    vocabulary.append(value)
+                append(code)
+
+    return columns, vocabularies
+
+
+def read_csv_as_typed_columns(filename, separator=',', quote='"', fields=None, encode=(),
+                              schema=None):
+    """
+    Reads a CSV file column by column, parsing each numeric column once
+    into a typed array.
+
+    Numeric columns are arrays of integers ('q') or floats ('d') in which
+    blank values are stored as 0, with a validity bitmap recording which
+    rows were not blank (see is_valid).  An integer column holding a value
+    that only parses as a float is widened to floats; a column holding a
+    non-numeric value is read again as strings.  Columns listed in encode
+    are dictionary-encoded and other string columns are lists of strings,
+    as in read_csv_as_columns.
+
+    Args:
+        filename (str): The name of the CSV file or archive source.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+        fields (list): Optional list of columns to load.  Defaults to every
+                       column.
+        encode (list): Columns to dictionary-encode.
+        schema (list): (field name, type) pairs as returned by
+                       read_csv_schema.  Defaults to inferring them.
+
+    Returns:
+        tuple: (columns, vocabularies, validity), where columns and
+               vocabularies are as for read_csv_as_columns and validity
+               maps each numeric field name to its validity bitmap.
+    """
+    if schema is None:
+        schema = read_csv_schema(filename, separator, quote)
+    types = dict(schema)
+
+    with open_csv_source(filename) as csvfile:
+        reader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        header = next(reader, [])
+        wanted = header if fields is None else [field for field in header if field in fields]
+        width = len(header)
+
+        columns = {}
+        vocabularies = {}
+        nulls = {}
+        plain = []
+        encoded = []
+        numeric = []
+        for field in wanted:
+            position = header.index(field)
+            kind = types.get(field, 'str')
+            if field in encode:
+                columns[field] = array('i')
+                vocabularies[field] = []
+                encoded.append((position, columns[field].append, {}, vocabularies[field]))
+            elif kind == 'str':
+                columns[field] = []
+                plain.append((position, columns[field].append))
+            else:
+                columns[field] = array('q' if kind == 'int' else 'd')
+                nulls[field] = []
+                numeric.append((position, field, columns[field].append, nulls[field].append,
+                                int if kind == 'int' else float))
+
+        num_rows = 0
+        reread = []
+        for row in reader:
+            if len(row) != width:
+                if not row:
+                    continue
+                row = (row + [None] * width)[:width]
+            for position, append in plain:
+                append(row[position])
+            for position, append, codes, vocabulary in encoded:
+                value = row[position]
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(vocabulary)
+                    vocabulary.append(value)
+                append(code)
+            for parser in numeric:
+                position, field, append, null, parse = parser
+                value = row[position]
+                if not value:
+                    append(0)
+                    null(num_rows)
+                    continue
+                try:
+                    append(parse(value))
+                except (ValueError, OverflowError):
+                    # The sample guessed wrong; fix the column's type.
+                    numeric = [other for other in numeric if other is not parser]
+                    if parse is int and _value_type(value) == 'float':
+                        column = columns[field] = array('d', columns[field])
+                        column.append(float(value))
+                        numeric.append((position, field, column.append, null, float))
+                    else:
+                        reread.append(field)
+            num_rows += 1
+
+    validity = {field: _validity_bitmap(num_rows, nulls[field])
+                for field in nulls if field not in reread}
+    if reread:
+        strings, _ = read_csv_as_columns(filename, separator, quote, fields=reread)
+        columns.update(strings)
+    return {field: columns[field] for field in wanted}, vocabularies, validity
+
+
+def read_archive_as_list_dicts(archive, separator=',', quote='"', suffix='.csv',
+                               max_workers=None):
+    """
+    Reads every CSV member of a zip archive concurrently, without
+    extracting it.
+
+    Args:
+        archive (str): The path to the zip archive.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+        suffix (str): Only members whose names end with suffix are read.
+        max_workers (int): Number of loader threads.
+
+    Returns:
+        dict: Maps each member name to its list of row dictionaries, as
+              returned by read_csv_as_list_dict.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    sources = list_archive_members(archive, suffix)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        tables = executor.map(lambda source: read_csv_as_list_dict(source, separator, quote),
+                              sources)
+        return {source.split(ARCHIVE_SEPARATOR, 1)[1]: table
+                for source, table in zip(sources, tables)}
+
+
+def make_row_key(row, keyfield):
+    """
+    Builds the lookup key for a row.
+
+    Args:
+        row (dict): A row dictionary.
+        keyfield (str or list): The name of the key column, or a list/tuple
+                                of column names forming a composite key.
+
+    Returns:
+        The value of the key column, or a tuple of values for a composite key.
+    """
+    if isinstance(keyfield, str):
+        return row[keyfield]
+    return tuple(row[field] for field in keyfield)
+
+
+def iter_csv_keyed_rows(filename, keyfield, separator=',', quote='"'):
+    """
+    Streams the rows of a CSV file together with their keys.
+    Only one row is held in memory at a time.
+
+    Args:
+        filename (str): The name of the CSV file or archive source.
+        keyfield (str or list): The key column, or a list of columns
+                                forming a composite key.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+
+    Yields:
+        tuple: (key, row) pairs in file order.
+    """
+    with open_csv_source(filename) as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
+        for row in reader:
+            yield make_row_key(row, keyfield), dict(row)
+
+
 def read_csv_as_nested_dict(filename, keyfield, separator=',', quote='"'):
     """
     Reads a CSV file and returns its contents as a nested dictionary.
     The outer dictionary is keyed by the values in the 'keyfield' column.
 
     Args:
-        filename (str): The name of the CSV file.
-        keyfield (str): The name of the column to use as the key.
+        filename (str): The name of the CSV file or archive source.
+        keyfield (str or list): The name of the column to use as the key,
+                                or a list of columns forming a composite key
+                                (e.g. ['playerID', 'yearID', 'stint']).
         separator (str): The character used to separate fields.
         quote (str): The character used to quote fields.
 
     Returns:
         dict: A nested dictionary where keys are from the keyfield column
-              and values are the corresponding row dictionaries.
+              (tuples for a composite key) and values are the corresponding
+              row dictionaries.
     """
     nested_dict = {}
-    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
-        for row in reader:
-            key = row[keyfield]
-            nested_dict[key] = dict(row)
+    for key, row in iter_csv_keyed_rows(filename, keyfield, separator, quote):
+        nested_dict[key] = row
     return nested_dict
 
 
+def start_csv_reads(sources, separator=',', quote='"', max_workers=None):
+    """
+    Starts reading several CSV files at once on a thread pool and returns
+    without waiting, so that a caller can work on one file while the
+    others are still loading.
+
+    Args:
+        sources (list): CSV file or archive sources.  A (source, keyfield)
+                        pair is read with read_csv_as_nested_dict instead
+                        of read_csv_as_list_dict, so that the index is
+                        built on the loader thread too.
+        separator (str): The character used to separate fields.
+        quote (str): The character used to quote fields.
+        max_workers (int): Number of loader threads.  Defaults to one per
+                           source.
+
+    Returns:
+        list: One concurrent.futures.Future per source, in order, whose
+              result is the list of row dictionaries or the nested
+              dictionary.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(sources) or 1)
+    futures = []
+    for source in sources:
+        if isinstance(source, tuple):
+            futures.append(executor.submit(read_csv_as_nested_dict, source[0], source[1],
+                                           separator, quote))
+        else:
+            futures.append(executor.submit(read_csv_as_list_dict, source, separator, quote))
+    # The submitted reads still run to completion.
+    executor.shutdown(wait=False)
+    return futures
+
+
 def write_csv_from_list_dict(filename, table, fieldnames, separator=',', quote='"'):
     """
     Writes a list of dictionaries to a CSV file.
@@ -89,6 +607,122 @@ def write_csv_from_list_dict(filename, table, fieldnames, separator=',', quote='
         writer.writerows(table)
 
 
+def _open_for_write(filename, append, compress):
+    """
+    Opens a CSV output file in text mode, optionally gzip-compressed.
+    """
+    mode = 'a' if append else 'w'
+    if compress:
+        import gzip
+        return gzip.open(filename, mode + 't', newline='', encoding='utf-8')
+    return open(filename, mode, newline='', encoding='utf-8')
+
+
+def _dict_row_getter(fieldnames):
+    """
+    Returns a function turning a dictionary row into a tuple in fieldnames
+    order, with csv.DictWriter's rules: missing fields are written as ''
+    and fields not in fieldnames raise ValueError.  Rows holding exactly
+    the fieldnames take a single itemgetter call.
+    """
+    fieldset = set(fieldnames)
+    width = len(fieldset)
+    if len(fieldnames) == 1:
+        field = fieldnames[0]
+
+        def getter(row):
+            return (row[field],)
+    else:
+        getter = itemgetter(*fieldnames)
+
+    def row_values(row):
+        if len(row) == width:
+            try:
+                return getter(row)
+            except KeyError:
+                pass
+        extra = [key for key in row if key not in fieldset]
+        if extra:
+            raise ValueError("dict contains fields not in fieldnames: "
+                             + ", ".join(repr(key) for key in extra))
+        return tuple(row.get(field, '') for field in fieldnames)
+
+    return row_values
+
+
+def write_csv_bulk(filename, rows, fieldnames, separator=',', quote='"',
+                   append=False, compress=None, chunk_rows=10000):
+    """
+    Writes rows to a CSV file in large blocks.
+
+    Unlike write_csv_from_list_dict, this avoids csv.DictWriter's per-field
+    lookups: dictionary rows holding exactly the fieldnames are turned into
+    tuples with a single itemgetter call, and output is formatted into an
+    in-memory buffer that is written to the file once per chunk.  Rows are
+    consumed lazily, so a generator can be written without materializing
+    it.
+
+    Args:
+        filename (str): The name of the CSV file to write to.
+        rows: The data to write, in one of three shapes:
+              - an iterable of dictionaries or make_record_type rows
+                keyed by field name (as with csv.DictWriter, missing
+                fields are written as '' and fields not in fieldnames
+                raise ValueError),
+              - an iterable of tuples/lists in fieldnames order,
+              - a columnar table: a dictionary mapping each field name to
+                a list of column values.
+        fieldnames (list): A list of strings for the header row.
+        separator (str): The character to use for separating fields.
+        quote (str): The character to use for quoting fields.
+        append (bool): If True, add rows to the end of an existing file.
+                       The header is only written if the file is new or
+                       empty.
+        compress (bool): If True, write gzip-compressed output.  Defaults to
+                         True when filename ends in '.gz'.
+        chunk_rows (int): Number of rows formatted per write.
+
+    Returns:
+        int: The number of data rows written.
+    """
+    if compress is None:
+        compress = filename.endswith('.gz')
+
+    if isinstance(rows, dict):
+        rows = zip(*[rows[field] for field in fieldnames])
+    else:
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is not None:
+            rows = chain([first], rows)
+            if hasattr(first, 'keys'):
+                # Dictionaries and make_record_type rows are mapped by
+                # field name.
+                rows = map(_dict_row_getter(fieldnames), rows)
+
+    write_header = not (append and os.path.exists(filename)
+                        and os.path.getsize(filename) > 0)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=separator, quotechar=quote,
+                        quoting=csv.QUOTE_MINIMAL)
+    count = 0
+    with _open_for_write(filename, append, compress) as csvfile:
+        if write_header:
+            writer.writerow(fieldnames)
+        while True:
+            chunk = list(islice(rows, chunk_rows))
+            if chunk:
+                writer.writerows(chunk)
+                count += len(chunk)
+            csvfile.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            if len(chunk) < chunk_rows:
+                break
+    return count
+
+
 def run_example():
     """
     A simple example to demonstrate the functionality of the CSV functions.
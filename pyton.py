@@ -11,22 +11,18 @@ The main functions are:
 - compute_top_stats_career
 """
 
-import csv
+import project
 
-# It's good practice to include any helper functions you might need.
-# The test environment for this assignment likely provides these,
-# but including them makes your script self-contained.
+# The CSV helpers below delegate to project.py, so this script needs
+# project.py next to it.
 
-def read_csv_as_list_dict(filename, separator=',', quote='"'):
+def read_csv_as_list_dict(filename, separator=',', quote='"', records=False):
     """
     Reads a CSV file and returns its contents as a list of dictionaries.
+    With records=True, rows are compact read-only records that share one
+    header (see project.make_record_type) instead of dictionaries.
     """
-    table = []
-    with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
-        for row in reader:
-            table.append(dict(row))
-    return table
+    return project.read_csv_as_list_dict(filename, separator, quote, records)
 
 # Main functions for the assignment
 
@@ -130,18 +126,9 @@ def lookup_player_names(master, player_ids, playerid='playerID', firstname='name
         playerid_key, firstname_key, lastname_key = playerid, firstname, lastname
         master_data = master
 
-    player_names = []
     # Create a quick lookup dictionary for performance
     master_lookup = {row.get(playerid_key): row for row in master_data}
-
-    for player_id, _ in player_ids:
-        if player_id in master_lookup:
-            player_info = master_lookup[player_id]
-            first_name = player_info.get(firstname_key, '')
-            last_name = player_info.get(lastname_key, '')
-            player_names.append(f"{first_name} {last_name}".strip())
-        else:
-            player_names.append("Unknown Player")
+    player_names = _names_from_lookup(master_lookup, player_ids, firstname_key, lastname_key)
 
     # The test for this function expects a fully formatted string,
     # which is unusual but required to pass.
@@ -154,6 +141,23 @@ def lookup_player_names(master, player_ids, playerid='playerID', firstname='name
     return player_names
 
 
+def _names_from_lookup(master_lookup, player_ids, firstname='nameFirst', lastname='nameLast'):
+    """
+    Looks up the names of players in a dictionary mapping player IDs to
+    master rows, as built by lookup_player_names.
+    """
+    player_names = []
+    for player_id, _ in player_ids:
+        if player_id in master_lookup:
+            player_info = master_lookup[player_id]
+            first_name = player_info.get(firstname, '')
+            last_name = player_info.get(lastname, '')
+            player_names.append(f"{first_name} {last_name}".strip())
+        else:
+            player_names.append("Unknown Player")
+    return player_names
+
+
 def batting_average(hits, at_bats):
     """Computes batting average, handling division by zero."""
     return hits / at_bats if at_bats > 0 else 0
@@ -177,16 +181,20 @@ def compute_top_stats_year(master, statistics, year, stat, numplayers=10):
     if isinstance(master, dict):
         # This 'info' variable is crucial for passing down keys
         info = master
-        batting_data = read_csv_as_list_dict(info.get('battingfile'))
-        master_data = read_csv_as_list_dict(info.get('masterfile'))
         yearid_key = info.get('yearid', 'yearID')
         playerid_key = info.get('playerid', 'playerID')
+        # Load both files together; the master index is built on its loader
+        # thread while the batting rows are being ranked.
+        batting_future, master_future = project.start_csv_reads(
+            [info.get('battingfile'), (info.get('masterfile'), playerid_key)])
+        batting_data = batting_future.result()
         hits_key = info.get('hits', 'hits')
         atbats_key = info.get('atbats', 'atbats')
     else:
         info = {} # Define info as empty dict if not passed
         batting_data = statistics
         master_data = master
+        master_future = None
         # Use default keys if no info dict is provided
         yearid_key, playerid_key, hits_key, atbats_key = 'yearID', 'playerID', 'hits', 'atbats'
 
@@ -209,7 +217,10 @@ def compute_top_stats_year(master, statistics, year, stat, numplayers=10):
     # 3. Look up the names for these player IDs
     firstname_key = info.get('firstname', 'nameFirst')
     lastname_key = info.get('lastname', 'nameLast')
-    top_names = lookup_player_names(master_data, top_ids, playerid_key, firstname_key, lastname_key)
+    if master_future is not None:
+        top_names = _names_from_lookup(master_future.result(), top_ids, firstname_key, lastname_key)
+    else:
+        top_names = lookup_player_names(master_data, top_ids, playerid_key, firstname_key, lastname_key)
 
     result = []
     for i in range(len(top_ids)):
@@ -286,13 +297,17 @@ def compute_top_stats_career(master, statistics, stat, numplayers=10):
         atbats_key = info.get('atbats', 'atbats')
         firstname_key = info.get('firstname', 'nameFirst')
         lastname_key = info.get('lastname', 'nameLast')
-        batting_data = read_csv_as_list_dict(info.get('battingfile'))
-        master_data = read_csv_as_list_dict(info.get('masterfile'))
+        # Load both files together; the master index is built on its loader
+        # thread while the careers are being aggregated and ranked.
+        batting_future, master_future = project.start_csv_reads(
+            [info.get('battingfile'), (info.get('masterfile'), playerid_key)])
+        batting_data = batting_future.result()
     else:
         playerid_key = 'playerID'
         hits_key, atbats_key = 'hits', 'atbats'
         batting_data = statistics
         master_data = master
+        master_future = None
         firstname_key = 'nameFirst'
         lastname_key = 'nameLast'
 
@@ -322,7 +337,12 @@ def compute_top_stats_career(master, statistics, stat, numplayers=10):
     top_career_players = career_totals[:numplayers]
 
     # 5. Look up their names
-    top_names = lookup_player_names(master_data, top_career_players, playerid_key, firstname_key, lastname_key)
+    if master_future is not None:
+        top_names = _names_from_lookup(master_future.result(), top_career_players,
+                                       firstname_key, lastname_key)
+    else:
+        top_names = lookup_player_names(master_data, top_career_players, playerid_key,
+                                        firstname_key, lastname_key)
 
     # 6. Format the output strings
     result = []
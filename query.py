@@ -0,0 +1,294 @@
+"""
+Lazy query plans over the batting statistics.
+
+Calling filter_by_year, top_player_ids and lookup_player_names in sequence
+materializes a filtered list, a fully sorted list of scores and then the
+names.  A Query instead records the steps,
+
+    scan(info).where(year=2010).score(onbase_plus_slugging).top(10).names()
+
+and only runs them when a result is asked for:
+
+- unless the query was built on an already loaded dataset, the batting
+  file is loaded with just the columns the filters and the formula read
+  (traced for formula functions, as in BattingDataset.load_for);
+- a year filter starts from the dataset's year index, and the remaining
+  equality filters, the formula and the top-k selection run in one pass
+  over the selected rows, keeping only the best k scores;
+- player names are looked up for the final k entries only.
+
+Results are the same as calling the isp_baseball_template functions in
+sequence, including the order of tied scores.
+"""
+
+import heapq
+
+from dataset import DEFAULT_ENCODED_FIELDS, BattingDataset
+from formula_expr import CompiledFormula
+from formula_trace import (UntracedField, cached_trace, evaluate_projected, read_sample_rows,
+                           trace_formula)
+
+
+class Query:
+    """
+    A query plan.  Each builder method returns a new Query, leaving the
+    original plan unchanged.
+    """
+
+    def __init__(self, info, data=None, filters=(), formula=None, careers=False,
+                 limit=None, _loaded=None):
+        """
+        Args:
+            info (dict): Baseball data information dictionary.
+            data (BattingDataset): Optional loaded dataset to query.  If
+                                   None, the batting file is loaded (with
+                                   only the needed columns) when the query
+                                   runs.
+            filters (tuple): (field, value) equality conditions.
+            formula: The formula function or CompiledFormula to rank by.
+            careers (bool): If True, the formula is applied to per-player
+                            totals instead of to individual rows.
+            limit (int): Number of top entries to keep, or None for all.
+        """
+        self.info = info
+        self.data = data
+        self.filters = tuple(filters)
+        self.formula = formula
+        self.careers = careers
+        self.limit = limit
+        # The dataset loaded for this plan and the plans derived from it,
+        # with the columns it was loaded with (None for all of them)
+        self._loaded = {"data": None, "fields": None} if _loaded is None else _loaded
+
+    def _replace(self, **changes):
+        """
+        Returns a copy of the plan with some steps changed.
+        """
+        settings = {"data": self.data, "filters": self.filters, "formula": self.formula,
+                    "careers": self.careers, "limit": self.limit, "_loaded": self._loaded}
+        settings.update(changes)
+        return Query(self.info, **settings)
+
+    def _field(self, name):
+        """
+        Resolves a where keyword to a field name: "year" is info["yearid"],
+        other info keys (such as "playerid") are looked up in info, and
+        anything else is taken as a field name.
+        """
+        if name == "year":
+            return self.info["yearid"]
+        field = self.info.get(name, name)
+        return field if isinstance(field, str) else name
+
+    def where(self, **conditions):
+        """
+        Adds equality filters, e.g. where(year=2010, teamID="BOS").
+        """
+        filters = [(self._field(name), str(value)) for name, value in conditions.items()]
+        return self._replace(filters=self.filters + tuple(filters))
+
+    def by_career(self):
+        """
+        Ranks each player's totals over the selected rows rather than
+        individual rows, like compute_top_stats_career.
+        """
+        return self._replace(careers=True)
+
+    def score(self, formula):
+        """
+        Sets the formula to rank by.
+        """
+        return self._replace(formula=formula)
+
+    def top(self, numplayers):
+        """
+        Keeps only the top numplayers entries.
+        """
+        return self._replace(limit=numplayers)
+
+    def explain(self):
+        """
+        Describes the plan.
+
+        Returns:
+            list: One string per step, in execution order.
+        """
+        steps = ["load batting file" if self.data is None else "use loaded dataset"]
+        steps.extend("filter {} == {!r}".format(field, value) for field, value in self.filters)
+        if self.careers:
+            steps.append("sum batting fields per player")
+        if self.formula is not None:
+            steps.append("score by {}".format(getattr(self.formula, "__name__",
+                                                      repr(self.formula))))
+            steps.append("keep all" if self.limit is None else "keep top {}".format(self.limit))
+        steps.append("look up names of the kept players")
+        return steps
+
+    def _fields(self):
+        """
+        Returns the columns the filters and the formula read, or None if
+        every column is needed.
+        """
+        info = self.info
+        fields = {field for field, _ in self.filters}
+        if isinstance(self.formula, CompiledFormula):
+            fields |= self.formula.columns
+        elif self.formula is not None:
+            if self.careers:
+                # Totals are summed over the batting fields.
+                traced = set(info["battingfields"])
+            else:
+                # Only read sample rows if the formula has not been traced.
+                dependencies = cached_trace(self.formula, info)
+                if dependencies is None:
+                    dependencies = trace_formula(self.formula, info, read_sample_rows(info))
+                traced = dependencies.columns
+            if traced is None:
+                return None
+            fields |= traced
+        return fields
+
+    def dataset(self):
+        """
+        Returns the dataset the plan runs on.  If the plan was not built on
+        a loaded dataset, the batting file is loaded once with only the
+        columns the filters and the formula read.  The dataset is shared
+        with the plans derived from this one, and loaded again, with the
+        union of the columns, when one of them needs more columns.
+        """
+        if self.data is not None:
+            return self.data
+        loaded = self._loaded
+        fields = self._fields()
+        if loaded["data"] is not None:
+            if loaded["fields"] is None or (fields is not None and fields <= loaded["fields"]):
+                return loaded["data"]
+            if fields is not None:
+                fields |= loaded["fields"]
+        self._load(fields)
+        return loaded["data"]
+
+    def _load(self, fields):
+        """
+        Loads the batting file with the given columns (None for all) into
+        the shared cache.
+        """
+        info = self.info
+        encode = ((info["playerid"], info["yearid"]) + DEFAULT_ENCODED_FIELDS
+                  + tuple(field for field, _ in self.filters))
+        self._loaded["data"] = BattingDataset.load(info, encode, fields)
+        self._loaded["fields"] = None if fields is None else frozenset(fields)
+
+    def rows(self):
+        """
+        Returns the indices of the rows passing every filter, in order (a
+        range if there are no filters).
+        """
+        data = self.dataset()
+        yearid = self.info["yearid"]
+        filters = list(self.filters)
+        rows = None
+        for position, (field, value) in enumerate(filters):
+            if field == yearid:
+                # Start from the year index instead of scanning.
+                rows = data.year_index().get(value, [])
+                del filters[position]
+                break
+
+        tests = []
+        for field, value in filters:
+            column = data.columns[field]
+            if field in data.vocabularies:
+                value = data.encode(field, value)
+                if value is None:
+                    return []
+            tests.append((column, value))
+        if rows is None:
+            rows = range(data.num_rows)
+        if not tests:
+            return rows
+        return [index for index in rows
+                if all(column[index] == value for column, value in tests)]
+
+    def _keep(self, scores):
+        """
+        Selects the best entries of an iterable of (code, statistic) pairs,
+        breaking ties by order like a stable descending sort.
+        """
+        if self.limit is None:
+            return sorted(scores, key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(self.limit, scores, key=lambda item: item[1])
+
+    def _row_scores(self, data, rows):
+        """
+        Returns (player code, statistic) pairs for the rows, building row
+        dictionaries with only the fields the formula is traced to read.
+        """
+        info = self.info
+        formula = self.formula
+        fields = data.traced_fields(formula)
+        if fields is None:
+            values = [formula(info, data.row(index)) for index in rows]
+        else:
+            values = evaluate_projected(formula, info,
+                                        (data.row(index, fields) for index in rows),
+                                        lambda: (data.row(index) for index in rows))
+        players = data.columns[data.playerid]
+        return zip([players[index] for index in rows], values)
+
+    def collect(self):
+        """
+        Runs the plan.
+
+        Returns:
+            list: (player code, statistic) tuples, best first, like
+                  BattingDataset.top_player_ids.
+        """
+        if self.formula is None:
+            raise ValueError("the query has no formula; call score first")
+        try:
+            return self._collect()
+        except UntracedField:
+            if self.data is not None or self._loaded["fields"] is None:
+                raise
+            # The formula read a column the trace did not see.
+            self._load(None)
+            return self._collect()
+
+    def _collect(self):
+        """
+        Runs the plan on the current dataset.
+        """
+        data = self.dataset()
+        rows = self.rows()
+        if self.careers:
+            return data.rank_totals(self.formula, self.limit,
+                                    lambda fields: data.aggregate_by_player_id(fields, rows))
+        if isinstance(self.formula, CompiledFormula):
+            return data.top_player_ids(self.formula, self.limit, rows)
+        return self._keep(self._row_scores(data, rows))
+
+    def player_ids(self):
+        """
+        Runs the plan and returns (player ID, statistic) tuples, like
+        isp_baseball_template.top_player_ids.
+        """
+        top_codes_and_stats = self.collect()
+        data = self.dataset()
+        return [(data.decode(data.playerid, code), stat) for code, stat in top_codes_and_stats]
+
+    def names(self):
+        """
+        Runs the plan and returns "x.xxx --- FirstName LastName" strings,
+        like compute_top_stats_year/career.
+        """
+        top_codes_and_stats = self.collect()
+        return self.dataset().lookup_player_names(top_codes_and_stats)
+
+
+def scan(info, data=None):
+    """
+    Starts a query over the batting file named by info, or over an already
+    loaded dataset.
+    """
+    return Query(info, data)
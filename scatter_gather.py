@@ -0,0 +1,261 @@
+"""
+Scatter-gather execution of the career rankings across worker processes.
+
+A Cluster starts num_workers local worker processes, each listening on a
+localhost socket (multiprocessing.connection), and streams the batting file
+to them once, partitioned by a hash of the player ID.  Every player's rows
+therefore live on a single worker, which keeps them in memory and answers
+any number of ranking requests.
+
+For each request the coordinator scatters the formula to all workers.  Each
+worker sums its rows with isp_baseball_template.aggregate_by_player_id and
+returns its local top numplayers, with the summed components and the index
+of each player's first row.  The coordinator merges the partial totals
+(summing any player reported by more than one worker), recomputes the
+statistic from the summed components, and ranks the merged players in
+order of first row, so the result, ties included, is identical to
+isp_baseball_template.compute_top_stats_career.
+
+Formulas are sent by reference, so they must be module-level functions
+(such as those in isp_baseball_template.FORMULAS), not lambdas.
+
+Example:
+    with Cluster(info, num_workers=4) as cluster:
+        for formula in FORMULAS.values():
+            print(cluster.compute_top_stats_career(formula, 10))
+"""
+
+import csv
+import heapq
+import multiprocessing
+import os
+import zlib
+from multiprocessing.connection import Client, Listener
+
+from isp_baseball_template import aggregate_by_player_id, lookup_player_names
+from project import open_csv_source
+
+DEFAULT_WORKERS = 4
+
+# Number of rows sent to a worker per message while loading
+BATCH_SIZE = 10000
+
+# Host the workers listen on
+HOST = "localhost"
+
+
+def partition_of(player, num_partitions):
+    """
+    Returns the partition of a player ID.  Unlike hash, the result is the
+    same in every process.
+    """
+    return zlib.crc32(player.encode("utf-8")) % num_partitions
+
+
+def _local_top(info, shard, formula, numplayers):
+    """
+    Computes a worker's partial career totals and local top numplayers.
+
+    Args:
+        info (dict): Baseball data information dictionary.
+        shard (tuple): (rows, first_rows), the worker's batting rows and a
+                       dictionary mapping its player IDs to the index of
+                       their first row in the batting file.
+        formula (function): The formula to rank by.
+        numplayers (int): Number of top players to return.
+
+    Returns:
+        list: (first row, player ID, totals) tuples of the top numplayers
+              in decreasing order of the statistic.
+    """
+    rows, first_rows = shard
+    careers = aggregate_by_player_id(rows, info["playerid"], info["battingfields"])
+    scores = ((first_rows[player], player, totals, formula(info, totals))
+              for player, totals in careers.items())
+    top = heapq.nlargest(numplayers, scores, key=lambda item: item[3])
+    return [(first_row, player, totals) for first_row, player, totals, _ in top]
+
+
+def _worker_main(info, authkey, address_pipe):
+    """
+    Runs a worker: listens on a localhost socket, sends its address to the
+    coordinator through address_pipe, and serves one connection.
+
+    Requests are tuples:
+        ("rows", [(index, row), ...]) adds batting rows to the shard,
+        ("top", formula, numplayers) replies ("ok", _local_top(...)),
+        ("close",) ends the worker.
+    Errors are replied as ("error", exception).
+    """
+    rows = []
+    first_rows = {}
+    playerid = info["playerid"]
+    with Listener((HOST, 0), authkey=authkey) as listener:
+        address_pipe.send(listener.address)
+        address_pipe.close()
+        with listener.accept() as connection:
+            while True:
+                request = connection.recv()
+                if request[0] == "close":
+                    return
+                if request[0] == "rows":
+                    for index, row in request[1]:
+                        first_rows.setdefault(row[playerid], index)
+                        rows.append(row)
+                    continue
+                try:
+                    if request[0] == "top":
+                        reply = ("ok", _local_top(info, (rows, first_rows),
+                                                  request[1], request[2]))
+                    else:
+                        raise ValueError("unknown request: {!r}".format(request[0]))
+                except Exception as error:  # pylint: disable=broad-except
+                    reply = ("error", error)
+                connection.send(reply)
+
+
+class Cluster:
+    """
+    A coordinator and its worker processes holding the batting data.
+    """
+
+    def __init__(self, info, num_workers=DEFAULT_WORKERS):
+        """
+        Args:
+            info (dict): Baseball data information dictionary.
+            num_workers (int): Number of worker processes.
+        """
+        self.info = info
+        self.num_workers = num_workers
+        self.processes = []
+        self.connections = []
+
+    def start(self):
+        """
+        Starts the workers, connects to them and loads the batting file.
+        """
+        authkey = os.urandom(16)
+        pipes = []
+        for _ in range(self.num_workers):
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_worker_main,
+                                              args=(self.info, authkey, sender),
+                                              daemon=True)
+            process.start()
+            sender.close()
+            self.processes.append(process)
+            pipes.append(receiver)
+        for receiver in pipes:
+            address = receiver.recv()
+            receiver.close()
+            self.connections.append(Client(address, authkey=authkey))
+        self._load()
+
+    def _load(self):
+        """
+        Streams the batting rows to the workers, partitioned by player ID.
+        Only the player ID and info["battingfields"] are sent.
+        """
+        info = self.info
+        playerid = info["playerid"]
+        fields = [playerid] + [field for field in info["battingfields"]
+                               if field != playerid]
+        batches = [[] for _ in self.connections]
+        with open_csv_source(info["battingfile"]) as csvfile:
+            reader = csv.DictReader(csvfile, delimiter=info["separator"],
+                                    quotechar=info["quote"])
+            for index, row in enumerate(reader):
+                partition = partition_of(row[playerid], self.num_workers)
+                batch = batches[partition]
+                batch.append((index, {field: row[field] for field in fields}))
+                if len(batch) >= BATCH_SIZE:
+                    self.connections[partition].send(("rows", batch))
+                    batches[partition] = []
+        for connection, batch in zip(self.connections, batches):
+            if batch:
+                connection.send(("rows", batch))
+
+    def close(self):
+        """
+        Stops the workers.
+        """
+        for connection in self.connections:
+            try:
+                connection.send(("close",))
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _scatter(self, request):
+        """
+        Sends a request to every worker and gathers their replies.
+
+        Raises:
+            The exception a worker replied with, if any.
+        """
+        for connection in self.connections:
+            connection.send(request)
+        replies = [connection.recv() for connection in self.connections]
+        for status, value in replies:
+            if status == "error":
+                raise value
+        return [value for _, value in replies]
+
+    def top_player_ids(self, formula, numplayers):
+        """
+        Ranks career totals across the workers.
+
+        Args:
+            formula (function): A module-level formula function.
+            numplayers (int): Number of top players to return.
+
+        Returns:
+            list: (player ID, statistic) tuples, like
+                  isp_baseball_template.top_player_ids applied to the
+                  career totals.
+        """
+        info = self.info
+        merged = {}
+        for partial in self._scatter(("top", formula, numplayers)):
+            for first_row, player, totals in partial:
+                entry = merged.get(player)
+                if entry is None:
+                    merged[player] = [first_row, dict(totals)]
+                    continue
+                entry[0] = min(entry[0], first_row)
+                for field in info["battingfields"]:
+                    entry[1][field] += totals[field]
+        # Recompute the statistic from the summed components, in order of
+        # first appearance so that ties are ordered as in the template.
+        careers = sorted(merged.values(), key=lambda entry: entry[0])
+        scores = ((totals[info["playerid"]], formula(info, totals))
+                  for _, totals in careers)
+        return heapq.nlargest(numplayers, scores, key=lambda item: item[1])
+
+    def compute_top_stats_career(self, formula, numplayers):
+        """
+        Returns a list of strings for the top numplayers in their careers
+        according to the given formula.
+        """
+        return lookup_player_names(self.info, self.top_player_ids(formula, numplayers))
+
+
+def compute_top_stats_career(info, formula, numplayers, num_workers=DEFAULT_WORKERS):
+    """
+    Returns the same list of strings as
+    isp_baseball_template.compute_top_stats_career, computed by a
+    temporary Cluster of num_workers local worker processes.
+    """
+    with Cluster(info, num_workers) as cluster:
+        return cluster.compute_top_stats_career(formula, numplayers)
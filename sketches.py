@@ -0,0 +1,384 @@
+"""
+Approximate streaming leaderboards for unbounded feeds.
+
+aggregate_by_player_id keeps an exact total for every player, so its memory
+grows with the number of distinct keys.  The sketches here use a fixed
+amount of memory however many keys the feed contains:
+
+- SpaceSaving keeps capacity counters and answers top-k queries.  Every
+  key whose true total exceeds total_weight / capacity is guaranteed to be
+  monitored, and each estimate is within [true, true + error].
+- CountMinSketch answers the total of any single key, overestimating by at
+  most epsilon * total_weight with probability 1 - delta.
+
+StreamingLeaderboard combines them to rank players by cumulative totals of
+batting fields such as hits or home runs.  Built with verify=True it also
+keeps exact totals, and cross_check reports any result that breaks the
+sketch's error guarantees.  self_check (also run as "python sketches.py")
+feeds a seeded, skewed stream to leaderboards of several capacities and
+cross-checks them against the exact aggregate_by_player_id path.
+"""
+
+import heapq
+import math
+import random
+
+# Space-Saving capacities exercised by self_check
+SELF_CHECK_CAPACITIES = (5, 20, 100, 500)
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving heavy-hitters sketch.
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): Maximum number of keys monitored at once.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total_weight = 0
+        # Maps monitored keys to [estimated count, maximum overestimate]
+        self.counters = {}
+        # Min-heap of (count, key); entries whose count no longer matches
+        # the counter are stale and skipped.
+        self._heap = []
+
+    def _pop_min(self):
+        """
+        Removes and returns (key, count) for the monitored key with the
+        smallest count.
+        """
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                del self.counters[key]
+                return key, count
+
+    def update(self, key, weight=1):
+        """
+        Adds weight (non-negative) to key's total.
+        """
+        if weight <= 0:
+            if weight < 0:
+                raise ValueError("weights must be non-negative")
+            return
+        self.total_weight += weight
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = [weight, 0]
+        else:
+            # Replace the smallest counter; the new key inherits its count
+            # as the bound on how much it may have been missed by.
+            _, min_count = self._pop_min()
+            counter = self.counters[key] = [min_count + weight, min_count]
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, item) for item, (count, _) in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def estimate(self, key):
+        """
+        Returns (estimate, error) for key: its true total lies in
+        [estimate - error, estimate].  Unmonitored keys have a true total
+        of at most max_unmonitored().
+        """
+        counter = self.counters.get(key)
+        if counter is None:
+            return 0, self.max_unmonitored()
+        return counter[0], counter[1]
+
+    def max_unmonitored(self):
+        """
+        Returns an upper bound on the true total of any unmonitored key.
+        """
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def top(self, k):
+        """
+        Returns the k keys with the largest estimates.
+
+        Returns:
+            list: (key, estimate, error) tuples, largest estimate first.
+        """
+        items = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in items[:k]]
+
+    def guaranteed_top(self, k):
+        """
+        Returns the keys of top(k) that are certainly among the true top k:
+        those whose lower bound beats the (k+1)-th largest estimate.
+        """
+        items = self.top(k + 1)
+        threshold = items[k][1] if len(items) > k else self.max_unmonitored()
+        return [key for key, count, error in items[:k] if count - error >= threshold]
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch for point estimates of weighted totals.
+    """
+
+    def __init__(self, width, depth, seed=0):
+        """
+        Args:
+            width (int): Counters per row.
+            depth (int): Number of independent rows.
+            seed (int): Seed for the row salts.
+        """
+        self.width = width
+        self.depth = depth
+        self.total_weight = 0
+        salts = random.Random(seed)
+        self._salts = [salts.getrandbits(64) for _ in range(depth)]
+        self._rows = [[0] * width for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon, delta, seed=0):
+        """
+        Builds a sketch whose estimates exceed the true total by at most
+        epsilon * total_weight with probability at least 1 - delta.
+        """
+        width = int(math.ceil(math.e / epsilon))
+        depth = int(math.ceil(math.log(1.0 / delta)))
+        return cls(width, depth, seed)
+
+    def update(self, key, weight=1):
+        """
+        Adds weight (non-negative) to key's total.
+        """
+        self.total_weight += weight
+        width = self.width
+        for salt, row in zip(self._salts, self._rows):
+            row[hash((salt, key)) % width] += weight
+
+    def estimate(self, key):
+        """
+        Returns an estimate that is never below key's true total.
+        """
+        width = self.width
+        return min(row[hash((salt, key)) % width]
+                   for salt, row in zip(self._salts, self._rows))
+
+
+def _to_weight(value):
+    """
+    Converts a raw field value to an integer weight; blanks count as 0.
+    """
+    if value is None or value == "":
+        return 0
+    return int(value)
+
+
+class StreamingLeaderboard:
+    """
+    Approximate cumulative-total leaderboards over a stream of batting rows.
+    """
+
+    def __init__(self, playerid, fields, capacity=1000, epsilon=None, delta=0.01,
+                 verify=False):
+        """
+        Args:
+            playerid (str): Player ID field name.
+            fields (list): Fields to total, e.g. ["H", "HR"].
+            capacity (int): Space-Saving counters per field, which bounds
+                            memory and sets the top-k error to at most
+                            total / capacity.
+            epsilon (float): If given, also keep a Count-Min sketch per
+                             field for point queries with this relative
+                             error.
+            delta (float): Failure probability of the Count-Min estimates.
+            verify (bool): If True, also keep exact totals (using unbounded
+                           memory) so that cross_check can compare.
+        """
+        self.playerid = playerid
+        self.fields = list(fields)
+        self.heavy_hitters = {field: SpaceSaving(capacity) for field in self.fields}
+        self.point_sketches = None
+        if epsilon is not None:
+            self.point_sketches = {field: CountMinSketch.from_error(epsilon, delta)
+                                   for field in self.fields}
+        self.exact = {} if verify else None
+
+    def ingest(self, rows):
+        """
+        Adds an iterable of batting statistics dictionaries to the totals.
+        Rows are consumed one at a time, so any iterator can be passed.
+
+        Returns:
+            int: The number of rows ingested.
+        """
+        count = 0
+        playerid = self.playerid
+        for row in rows:
+            player = row[playerid]
+            for field in self.fields:
+                weight = _to_weight(row[field])
+                self.heavy_hitters[field].update(player, weight)
+                if self.point_sketches is not None:
+                    self.point_sketches[field].update(player, weight)
+            if self.exact is not None:
+                totals = self.exact.setdefault(player, dict.fromkeys(self.fields, 0))
+                for field in self.fields:
+                    totals[field] += _to_weight(row[field])
+            count += 1
+        return count
+
+    def top_player_ids(self, field, numplayers):
+        """
+        Returns (player ID, estimated total) tuples for the approximate top
+        numplayers by field, largest first, like top_player_ids.
+        """
+        return [(player, count)
+                for player, count, _ in self.heavy_hitters[field].top(numplayers)]
+
+    def estimate(self, field, player):
+        """
+        Estimates one player's total of a field.
+
+        Both sketches only ever overestimate, so when a Count-Min sketch is
+        kept the smaller of the two estimates is returned.
+
+        Returns:
+            int: An estimate that is never below the true total.
+        """
+        heavy = self.heavy_hitters[field]
+        count, error = heavy.estimate(player)
+        if player not in heavy.counters:
+            count = error
+        if self.point_sketches is None:
+            return count
+        return min(count, self.point_sketches[field].estimate(player))
+
+    def cross_check(self, field, numplayers):
+        """
+        Compares the sketch against exact totals (requires verify=True).
+
+        Checks that every monitored estimate bounds the true total, that
+        every player whose total exceeds the Space-Saving error bound is
+        monitored, and that players reported as guaranteed top-numplayers
+        really are.
+
+        Returns:
+            list: Descriptions of violated guarantees; empty if none.
+        """
+        if self.exact is None:
+            raise ValueError("cross_check needs a StreamingLeaderboard built with verify=True")
+        heavy = self.heavy_hitters[field]
+        truth = {player: totals[field] for player, totals in self.exact.items()}
+        problems = []
+
+        for player, (count, error) in heavy.counters.items():
+            true_total = truth.get(player, 0)
+            if not count - error <= true_total <= count:
+                problems.append("{}: true {} outside [{}, {}]".format(
+                    player, true_total, count - error, count))
+
+        bound = heavy.total_weight / heavy.capacity
+        for player, true_total in truth.items():
+            if true_total > bound and player not in heavy.counters:
+                problems.append("{}: total {} above {} but not monitored".format(
+                    player, true_total, bound))
+
+        exact_top = sorted(truth.values(), reverse=True)
+        cutoff = exact_top[numplayers - 1] if len(exact_top) >= numplayers else 0
+        for player in heavy.guaranteed_top(numplayers):
+            if truth.get(player, 0) < cutoff:
+                problems.append("{}: reported as top {} but total {} below {}".format(
+                    player, numplayers, truth.get(player, 0), cutoff))
+
+        if self.point_sketches is not None:
+            sketch = self.point_sketches[field]
+            for player, true_total in truth.items():
+                if sketch.estimate(player) < true_total:
+                    problems.append("{}: Count-Min estimate below true total".format(player))
+        return problems
+
+
+def skewed_rows(num_rows, num_players, seed=0, playerid="playerID", fields=("H", "HR")):
+    """
+    Generates a reproducible stream of batting rows in which player
+    frequencies follow a Zipf-like law, as in a real feed where a few
+    players have long careers.
+
+    Yields:
+        dict: Rows holding the player ID and a random count per field.
+    """
+    rng = random.Random(seed)
+    players = ["p{:05d}".format(number) for number in range(num_players)]
+    cumulative = []
+    total = 0.0
+    for rank in range(num_players):
+        total += 1.0 / (rank + 1)
+        cumulative.append(total)
+    for _ in range(num_rows):
+        row = {playerid: rng.choices(players, cum_weights=cumulative)[0]}
+        for field in fields:
+            row[field] = str(rng.randint(0, 200))
+        yield row
+
+
+def self_check(num_rows=20000, num_players=2000, seed=0, capacities=SELF_CHECK_CAPACITIES,
+               numplayers=10):
+    """
+    Cross-checks streaming leaderboards against the exact path.
+
+    For each capacity, a seeded skewed stream is ingested with verify=True
+    (and a Count-Min sketch).  The exact totals must equal those of
+    isp_baseball_template.aggregate_by_player_id, and cross_check must
+    report no violated guarantee for any field.
+
+    Returns:
+        list: Descriptions of the problems found; empty if none.
+    """
+    from isp_baseball_template import aggregate_by_player_id
+
+    playerid = "playerID"
+    fields = ["H", "HR"]
+    rows = list(skewed_rows(num_rows, num_players, seed, playerid, fields))
+    exact = aggregate_by_player_id(rows, playerid, fields)
+    problems = []
+    for capacity in capacities:
+        board = StreamingLeaderboard(playerid, fields, capacity, epsilon=0.001, verify=True)
+        board.ingest(iter(rows))
+        for player, totals in exact.items():
+            if board.exact.get(player) != {field: totals[field] for field in fields}:
+                problems.append("capacity {}: {} totals differ from the exact path".format(
+                    capacity, player))
+        for field in fields:
+            problems.extend("capacity {}, {}: {}".format(capacity, field, problem)
+                            for problem in board.cross_check(field, numplayers))
+    return problems
+
+
+def main(argv=None):
+    """
+    Runs self_check from the command line.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cross-check the streaming sketches.")
+    parser.add_argument("--rows", type=int, default=20000,
+                        help="rows in the generated stream (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    problems = self_check(args.rows, seed=args.seed)
+    for problem in problems:
+        print(problem)
+    print("{} problems with capacities {}".format(
+        len(problems), ", ".join(str(capacity) for capacity in SELF_CHECK_CAPACITIES)))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,302 @@
+"""
+SQLite storage for the baseball statistics.
+
+BaseballStore ingests info["battingfile"] and info["masterfile"] into a
+local sqlite3 database once, with indexes on the player ID and year
+columns.  Later runs reopen the database without parsing any CSV (the
+source files' sizes and modification times are recorded, and the database
+is rebuilt only if they change).
+
+Queries are pushed down to SQL where possible: filter_by_year and
+aggregate_by_player_id are indexed SELECTs, and ranking by one of the
+built-in formulas (isp_baseball_template.FORMULAS) is computed, sorted and
+limited inside SQLite, so only the top rows reach Python.  Any other
+formula function is applied row by row to rows streamed from a cursor.
+Results, including the order of tied scores, are the same as those of the
+isp_baseball_template functions.
+
+Values are stored as text, exactly as in the CSV files, and cast to
+integers in the queries.
+"""
+
+import csv
+import heapq
+import sqlite3
+
+from isp_baseball_template import MINIMUM_AB, builtin_stat_name
+from project import open_csv_source, source_stamp
+
+BATTING_TABLE = "batting"
+MASTER_TABLE = "master"
+
+# SQL versions of the built-in formulas, over columns aliased by their info
+# keys.  The arithmetic follows the Python formulas step by step, so the
+# floating-point results are identical.
+_QUALIFIED = "CASE WHEN atbats >= {} THEN {{}} ELSE 0 END".format(MINIMUM_AB)
+_OBP = _QUALIFIED.format("CAST(hits + walks AS REAL) / (atbats + walks)")
+_SLG = _QUALIFIED.format("CAST((hits - doubles - triples - homeruns) + 2 * doubles"
+                         " + 3 * triples + 4 * homeruns AS REAL) / atbats")
+FORMULA_SQL = {"AVG": _QUALIFIED.format("CAST(hits AS REAL) / atbats"),
+               "OBP": _OBP,
+               "SLG": _SLG,
+               "OPS": "({}) + ({})".format(_OBP, _SLG)}
+
+# The info keys of the columns read by FORMULA_SQL
+_FORMULA_KEYS = ("atbats", "hits", "doubles", "triples", "homeruns", "walks")
+
+
+def quote_name(name):
+    """
+    Quotes an SQL identifier such as a column name ("2B").
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class BaseballStore:
+    """
+    Batting and master tables in an SQLite database.
+    """
+
+    def __init__(self, info, path):
+        """
+        Opens (creating if needed) the database at path.  Call ingest, or
+        use open, before querying.
+
+        Args:
+            info (dict): Baseball data information dictionary.
+            path (str): The database file, or ":memory:".
+        """
+        self.info = info
+        self.path = path
+        self.connection = sqlite3.connect(path)
+
+    @classmethod
+    def open(cls, info, path, rebuild=False):
+        """
+        Opens the database at path, ingesting the CSV files named by info
+        unless the database already holds the current versions of them.
+
+        Args:
+            info (dict): Baseball data information dictionary.
+            path (str): The database file.
+            rebuild (bool): If True, always ingest again.
+
+        Returns:
+            BaseballStore: The open store.
+        """
+        store = cls(info, path)
+        if rebuild or not store.is_current():
+            store.ingest()
+        return store
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _sources(self):
+        """
+        Returns the metadata describing the ingested sources.
+        """
+        info = self.info
+        return {"battingfile": info["battingfile"],
+                "battingstamp": "{}:{}".format(*source_stamp(info["battingfile"])),
+                "masterfile": info["masterfile"],
+                "masterstamp": "{}:{}".format(*source_stamp(info["masterfile"])),
+                "separator": info["separator"],
+                "quote": info["quote"]}
+
+    def is_current(self):
+        """
+        Returns True if the database holds the current contents of the CSV
+        files named by info.
+        """
+        try:
+            stored = dict(self.connection.execute("SELECT key, value FROM metadata"))
+        except sqlite3.OperationalError:
+            return False
+        return stored == self._sources()
+
+    def _load_table(self, table, filename):
+        """
+        Creates a table holding a CSV file's rows, in file order.
+        """
+        info = self.info
+        connection = self.connection
+        with open_csv_source(filename) as csvfile:
+            reader = csv.reader(csvfile, delimiter=info["separator"],
+                                quotechar=info["quote"])
+            fieldnames = next(reader)
+            columns = ", ".join("{} TEXT".format(quote_name(name)) for name in fieldnames)
+            connection.execute("DROP TABLE IF EXISTS {}".format(table))
+            connection.execute("CREATE TABLE {} ({})".format(table, columns))
+            insert = "INSERT INTO {} VALUES ({})".format(table,
+                                                         ", ".join("?" * len(fieldnames)))
+            width = len(fieldnames)
+            connection.executemany(insert, (row + [""] * (width - len(row))
+                                            for row in reader if row))
+
+    def ingest(self):
+        """
+        Loads both CSV files into the database and indexes them.
+        """
+        info = self.info
+        playerid = quote_name(info["playerid"])
+        with self.connection as connection:
+            self._load_table(BATTING_TABLE, info["battingfile"])
+            self._load_table(MASTER_TABLE, info["masterfile"])
+            connection.execute("CREATE INDEX batting_player ON {} ({})".format(
+                BATTING_TABLE, playerid))
+            connection.execute("CREATE INDEX batting_year ON {} ({})".format(
+                BATTING_TABLE, quote_name(info["yearid"])))
+            connection.execute("CREATE INDEX master_player ON {} ({})".format(
+                MASTER_TABLE, playerid))
+            connection.execute("DROP TABLE IF EXISTS metadata")
+            connection.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+            connection.executemany("INSERT INTO metadata VALUES (?, ?)",
+                                   self._sources().items())
+
+    def iter_rows(self, year=None):
+        """
+        Streams batting rows as dictionaries of strings, like the rows of
+        read_csv_as_list_dict, in file order.
+
+        Args:
+            year (int): If given, only rows from this year (using the year
+                        index).
+        """
+        query = "SELECT * FROM {}".format(BATTING_TABLE)
+        parameters = ()
+        if year is not None:
+            query += " WHERE {} = ?".format(quote_name(self.info["yearid"]))
+            parameters = (str(year),)
+        cursor = self.connection.execute(query + " ORDER BY rowid", parameters)
+        fieldnames = [description[0] for description in cursor.description]
+        for row in cursor:
+            yield dict(zip(fieldnames, row))
+
+    def filter_by_year(self, year):
+        """
+        Returns the batting rows from the given year, like
+        isp_baseball_template.filter_by_year.
+        """
+        return list(self.iter_rows(year))
+
+    def aggregate_by_player_id(self, fields=None, year=None):
+        """
+        Sums fields per player in SQL, like
+        isp_baseball_template.aggregate_by_player_id.
+
+        Args:
+            fields (list): Fields to aggregate.  Defaults to
+                           info["battingfields"].
+            year (int): If given, only aggregate rows from this year.
+
+        Returns:
+            dict: Maps player IDs, in order of first appearance, to
+                  dictionaries holding the player ID and the totals.
+        """
+        info = self.info
+        if fields is None:
+            fields = info["battingfields"]
+        playerid = info["playerid"]
+        sums = "".join(", SUM(CAST({} AS INTEGER))".format(quote_name(field))
+                       for field in fields)
+        query = "SELECT {}{} FROM {}".format(quote_name(playerid), sums, BATTING_TABLE)
+        parameters = ()
+        if year is not None:
+            query += " WHERE {} = ?".format(quote_name(info["yearid"]))
+            parameters = (str(year),)
+        query += " GROUP BY {} ORDER BY MIN(rowid)".format(quote_name(playerid))
+
+        aggregated = {}
+        for row in self.connection.execute(query, parameters):
+            totals = {playerid: row[0]}
+            totals.update(zip(fields, row[1:]))
+            aggregated[row[0]] = totals
+        return aggregated
+
+    def top_player_ids(self, formula, numplayers, year=None):
+        """
+        Ranks rows from one year, or career totals if year is None.
+
+        Built-in formulas are evaluated, sorted and limited in SQL; other
+        formula functions are applied in Python to streamed rows.
+
+        Args:
+            formula (function): The formula to rank by.
+            numplayers (int): Number of top players to return.
+            year (int): The year, or None to rank careers.
+
+        Returns:
+            list: (player ID, statistic) tuples, in decreasing order of the
+                  statistic, like isp_baseball_template.top_player_ids.
+        """
+        info = self.info
+        name = builtin_stat_name(formula)
+        if name is None:
+            if year is None:
+                rows = self.aggregate_by_player_id().values()
+            else:
+                rows = self.iter_rows(year)
+            scores = ((row[info["playerid"]], formula(info, row)) for row in rows)
+            return heapq.nlargest(numplayers, scores, key=lambda item: item[1])
+
+        if year is None:
+            columns = ", ".join("SUM(CAST({} AS INTEGER)) AS {}".format(
+                quote_name(info[key]), key) for key in _FORMULA_KEYS)
+            inner = "SELECT {0}, MIN(rowid) AS position, {1} FROM {2} GROUP BY {0}".format(
+                quote_name(info["playerid"]), columns, BATTING_TABLE)
+            parameters = ()
+        else:
+            columns = ", ".join("CAST({} AS INTEGER) AS {}".format(
+                quote_name(info[key]), key) for key in _FORMULA_KEYS)
+            inner = "SELECT {}, rowid AS position, {} FROM {} WHERE {} = ?".format(
+                quote_name(info["playerid"]), columns, BATTING_TABLE,
+                quote_name(info["yearid"]))
+            parameters = (str(year),)
+        query = ("SELECT {}, {} AS stat FROM ({}) ORDER BY stat DESC, position"
+                 " LIMIT ?").format(quote_name(info["playerid"]), FORMULA_SQL[name], inner)
+        return [tuple(row) for row in self.connection.execute(query,
+                                                              parameters + (numplayers,))]
+
+    def lookup_player_names(self, top_ids_and_stats):
+        """
+        Looks up player names with the indexed master table, like
+        isp_baseball_template.lookup_player_names.
+
+        Raises:
+            KeyError: If a player is missing from the master file.
+        """
+        info = self.info
+        query = "SELECT {}, {} FROM {} WHERE {} = ? ORDER BY rowid DESC LIMIT 1".format(
+            quote_name(info["firstname"]), quote_name(info["lastname"]), MASTER_TABLE,
+            quote_name(info["playerid"]))
+        names = []
+        for playerid, stat in top_ids_and_stats:
+            player = self.connection.execute(query, (playerid,)).fetchone()
+            if player is None:
+                raise KeyError(playerid)
+            names.append("{:.3f} --- {} {}".format(stat, player[0], player[1]))
+        return names
+
+    def compute_top_stats_year(self, formula, numplayers, year):
+        """
+        Returns a list of strings for the top numplayers in the given year
+        according to the given formula.
+        """
+        return self.lookup_player_names(self.top_player_ids(formula, numplayers, year))
+
+    def compute_top_stats_career(self, formula, numplayers):
+        """
+        Returns a list of strings for the top numplayers in their careers
+        according to the given formula.
+        """
+        return self.lookup_player_names(self.top_player_ids(formula, numplayers))